@@ -15,6 +15,7 @@ from marearts_anpr import (
     marearts_anpr_from_pil,
     marearts_anpr_from_cv2,
 )
+from batch_inference import crop_plate
 
 
 def load_credentials():
@@ -62,11 +63,11 @@ if __name__ == "__main__":
     for i, box in enumerate(detections):
         bbox = box.get("bbox", box.get("box"))
         l, t, r, b = int(bbox[0]), int(bbox[1]), int(bbox[2]), int(bbox[3])
-        crop_bgr = img_bgr[t:b, l:r]
-        if crop_bgr.size == 0:
+        # One copy straight from the frame buffer, BGR → RGB done by Pillow
+        crop_pil = crop_plate(img_bgr, [l, t, r, b])
+        if crop_pil is None:
             continue
 
-        crop_pil = Image.fromarray(crop_bgr[:, :, ::-1])
         t0 = time.time()
         text, conf = ocr.predict(crop_pil)
         elapsed = time.time() - t0
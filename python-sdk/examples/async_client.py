@@ -0,0 +1,196 @@
+"""MareArts ANPR — Asyncio Server Client
+
+AsyncAnprClient talks to one or more `ma-anpr server` instances with
+keep-alive connection pooling, a bound on in-flight requests, and retry
+with backoff on 503 / connection errors. detect_many() streams results
+as they complete instead of waiting on sequential round-trips.
+
+Prerequisites:
+    pip install httpx
+    ma-anpr server start
+
+Usage:
+    python async_client.py "../../sample_images/*.jpg"
+    python async_client.py "/data/batch/*.jpg" --ndjson results.ndjson
+    python async_client.py "/data/cam1/*.jpg" --server http://10.0.0.5:8000 \\
+        --server http://10.0.0.6:8000 --concurrency 32 --region eup
+"""
+import asyncio
+import glob
+import itertools
+import json
+import sys
+import time
+from pathlib import Path
+
+try:
+    import httpx
+except ImportError:
+    print("pip install httpx")
+    sys.exit(1)
+
+SERVER = "http://127.0.0.1:8000"
+RETRY_STATUS = {502, 503, 504}
+
+
+class AsyncAnprClient:
+    """Pooled async client for the ANPR REST API.
+
+    `servers` is one base URL or a list; requests are spread round-robin.
+    At most `concurrency` requests are in flight; a request that gets a
+    502/503/504 or a connection error is retried up to `retries` times with
+    exponential backoff (honouring Retry-After).
+    """
+
+    def __init__(self, servers=SERVER, concurrency=8, retries=3, backoff=0.5, timeout=30.0):
+        if isinstance(servers, str):
+            servers = [servers]
+        self.servers = [s.rstrip("/") for s in servers]
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self._next_server = itertools.cycle(self.servers)
+        self._sem = asyncio.Semaphore(concurrency)
+        self._http = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=concurrency,
+                                max_keepalive_connections=concurrency),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        await self._http.aclose()
+
+    async def _request(self, method, path, **kw):
+        async with self._sem:
+            for attempt in range(self.retries + 1):
+                url = f"{next(self._next_server)}{path}"
+                try:
+                    r = await self._http.request(method, url, **kw)
+                except httpx.TransportError:
+                    if attempt == self.retries:
+                        raise
+                else:
+                    if r.status_code not in RETRY_STATUS or attempt == self.retries:
+                        r.raise_for_status()
+                        return r.json()
+                    retry_after = r.headers.get("Retry-After", "")
+                    if retry_after.isdigit():
+                        await asyncio.sleep(int(retry_after))
+                        continue
+                await asyncio.sleep(self.backoff * (2 ** attempt))
+
+    async def health(self):
+        return await self._request("GET", "/api/health")
+
+    async def detect(self, image, region=None, mmc=False):
+        """Detect plates in a file path or encoded image bytes."""
+        if isinstance(image, (str, Path)):
+            data = await asyncio.to_thread(Path(image).read_bytes)
+            name = Path(image).name
+        else:
+            data, name = image, "image.jpg"
+        form = {"region": region} if region else None
+        path = "/api/anpr/mmc" if mmc else "/api/anpr"
+        return await self._request("POST", path, files={"image": (name, data)}, data=form)
+
+    async def detect_many(self, images, region=None, mmc=False):
+        """Yield (image, result) pairs as each request completes.
+
+        Images are read lazily, so an iterator over millions of paths is
+        fine. A failed image yields {"success": False, "error": ...} instead
+        of stopping the stream.
+        """
+        images = iter(images)
+        done = asyncio.Queue()
+        tasks = set()
+
+        async def _one(image):
+            try:
+                result = await self.detect(image, region=region, mmc=mmc)
+            except Exception as e:
+                result = {"success": False, "error": str(e)}
+            await done.put((image, result))
+
+        def _start(image):
+            task = asyncio.create_task(_one(image))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        # Keep 2x concurrency scheduled so the semaphore never starves.
+        pending = 0
+        for image in itertools.islice(images, self.concurrency * 2):
+            _start(image)
+            pending += 1
+        while pending:
+            item = await done.get()
+            pending -= 1
+            nxt = next(images, None)
+            if nxt is not None:
+                _start(nxt)
+                pending += 1
+            yield item
+
+
+async def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Send images to ANPR server(s) concurrently")
+    parser.add_argument("pattern", nargs="+", help="Image paths or glob patterns")
+    parser.add_argument("--server", action="append", help=f"Server URL (repeatable, default {SERVER})")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--region", default=None)
+    parser.add_argument("--mmc", action="store_true", help="Use /api/anpr/mmc")
+    parser.add_argument("--ndjson", default=None, metavar="FILE",
+                        help="Write one JSON line per image as it completes ('-' for stdout)")
+    args = parser.parse_args()
+
+    paths = sorted(p for pat in args.pattern for p in (glob.glob(pat) or [pat]))
+    if not paths:
+        print("No images found")
+        sys.exit(0)
+
+    # With --ndjson - the results own stdout; progress goes to stderr.
+    out = None
+    log = sys.stdout
+    if args.ndjson == "-":
+        out, log = sys.stdout, sys.stderr
+    elif args.ndjson:
+        out = open(args.ndjson, "w")
+
+    t_start = time.time()
+    first = None
+    ok = failed = plates = 0
+    try:
+        async with AsyncAnprClient(args.server or SERVER, concurrency=args.concurrency) as client:
+            async for path, data in client.detect_many(paths, region=args.region, mmc=args.mmc):
+                if first is None:
+                    first = time.time() - t_start
+                if out is not None:
+                    out.write(json.dumps({"file": str(path), **data}) + "\n")
+                    out.flush()
+                if data.get("success", True) and "error" not in data:
+                    ok += 1
+                    texts = [p.get("plate_text") for p in data.get("results", [])]
+                    plates += len(texts)
+                    print(f"  {Path(path).name}: {texts or '(no plates)'}  "
+                          f"({data.get('processing_sec', '?')}s)", file=log)
+                else:
+                    failed += 1
+                    print(f"  {Path(path).name}: ERROR {data.get('error')}", file=log)
+    finally:
+        if out is not None and out is not sys.stdout:
+            out.close()
+
+    total = time.time() - t_start
+    print(f"\nDone: {ok} ok, {failed} failed, {plates} plates, "
+          f"{total:.1f}s ({len(paths) / max(total, 1e-9):.1f} img/s), "
+          f"first result after {first or 0:.2f}s", file=log)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,51 +1,230 @@
 """MareArts ANPR — Batch Folder Processing
 
-Scan a folder of images, detect plates, and export results to CSV/JSON.
-Uses the Python SDK directly (no server needed).
+Scan a folder of images, detect plates, and export results to CSV, JSON
+Lines or Parquet. Uses the Python SDK directly (no server needed).
+
+Built for large archives:
+- a decode thread pool prefetches the next batches while the models run
+- frames go through anpr_batch() in batches of --batch-size
+- rows are appended to the output as each batch finishes, never held in RAM
+- a manifest next to the output records finished images, so a rerun
+  after a crash or Ctrl+C resumes where it stopped (--restart starts over);
+  images that failed to decode or run are left out and retried
+- a batch that raises is retried one image at a time, so one bad image
+  costs only itself
+- progress lines show throughput and ETA
+- --db also records every image in a SQLite history DB through the
+  write-behind HistoryWriter (history_writer.py)
 """
 import csv
 import json
 import os
 import sys
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from marearts_anpr import (
-    ma_anpr_detector_v16,
-    ma_anpr_ocr_v16,
-    marearts_anpr_from_image_file,
-)
+from batch_inference import DEFAULT_WORKERS, anpr_batch, load_credentials
+from pipeline import to_bgr
 
 EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+FIELDS = ["file", "plate", "ocr_conf", "det_conf", "bbox"]
+
 
+def scan_images(folder, recursive=False):
+    """Yield image paths under `folder` in a stable (sorted) order.
 
-def load_credentials():
-    user = os.getenv("MAREARTS_ANPR_USERNAME")
-    key = os.getenv("MAREARTS_ANPR_SERIAL_KEY")
-    sig = os.getenv("MAREARTS_ANPR_SIGNATURE")
-    if not all([user, key, sig]):
-        config_file = Path.home() / ".marearts" / ".marearts_env"
-        if config_file.exists():
-            for line in open(config_file):
-                if "USERNAME=" in line:
-                    user = line.split("=", 1)[1].strip().strip('"')
-                elif "SERIAL_KEY=" in line:
-                    key = line.split("=", 1)[1].strip().strip('"')
-                elif "SIGNATURE=" in line:
-                    sig = line.split("=", 1)[1].strip().strip('"')
-    return user, key, sig
-
-
-def scan_images(folder: str) -> list:
+    Directories are walked one at a time, so the full listing of a huge
+    archive is never built in memory.
+    """
     folder = Path(folder)
     if not folder.is_dir():
         print(f"ERROR: {folder} is not a directory")
         sys.exit(1)
-    images = sorted(
-        p for p in folder.iterdir()
-        if p.suffix.lower() in EXTENSIONS
-    )
-    return images
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        if not recursive:
+            dirs.clear()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in EXTENSIONS:
+                yield Path(root) / name
+
+
+class ResultWriter:
+    """Append-only writer for .csv, .jsonl, .json and .parquet outputs.
+
+    .json is written as JSON Lines to `<name>.jsonl` while running and
+    turned into one JSON array by finish(), after the rows of the array an
+    earlier run left (unless `restart`). .parquet is a directory of part
+    files (one per `parquet_rows` rows), readable with
+    pandas.read_parquet() or pyarrow.dataset; it requires pyarrow.
+    """
+
+    def __init__(self, path, restart=False, parquet_rows=50_000):
+        self.path = Path(path)
+        self.kind = self.path.suffix.lower().lstrip(".")
+        if self.kind not in ("csv", "jsonl", "json", "parquet"):
+            raise ValueError(f"unsupported output type: {self.path.suffix} "
+                             "(use .csv, .jsonl, .json or .parquet)")
+        self.rows = 0
+        self._pending = []
+        self._parquet_rows = parquet_rows
+
+        if self.kind == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                print("pip install pyarrow")
+                sys.exit(1)
+            self.path.mkdir(parents=True, exist_ok=True)
+            if restart:
+                for part in self.path.glob("part-*.parquet"):
+                    part.unlink()
+            self._part = len(list(self.path.glob("part-*.parquet")))
+            self._f = None
+            return
+
+        if self.kind == "json" and restart and self.path.exists():
+            self.path.unlink()  # not merged into the new array
+        target = self.path.with_suffix(".jsonl") if self.kind == "json" else self.path
+        new = restart or not target.exists() or target.stat().st_size == 0
+        self._f = open(target, "w" if new else "a", newline="")
+        if self.kind == "csv":
+            self._csv = csv.DictWriter(self._f, fieldnames=FIELDS)
+            if new:
+                self._csv.writeheader()
+
+    def write(self, rows):
+        """Append `rows`; True once every row written so far is on disk.
+
+        Parquet rows are buffered until a part file fills up, so write()
+        returns False until then.
+        """
+        self.rows += len(rows)
+        if self.kind == "parquet":
+            self._pending.extend(rows)
+            if len(self._pending) < self._parquet_rows:
+                return False
+            self._flush_parquet()
+            return True
+        for row in rows:
+            if self.kind == "csv":
+                self._csv.writerow(row)
+            else:
+                self._f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        return True
+
+    def _flush_parquet(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self._pending:
+            return
+        table = pa.Table.from_pylist(self._pending)
+        tmp = self.path / f".part-{self._part:05d}.tmp"
+        pq.write_table(table, tmp)
+        os.replace(tmp, self.path / f"part-{self._part:05d}.parquet")
+        self._part += 1
+        self._pending = []
+
+    def finish(self, complete=True):
+        """Flush and close; .json is assembled only once the run is `complete`."""
+        if self.kind == "parquet":
+            self._flush_parquet()
+            return
+        self._f.close()
+        if self.kind == "json" and complete:
+            jsonl = self.path.with_suffix(".jsonl")
+            if jsonl.stat().st_size == 0 and self.path.exists():
+                jsonl.unlink()  # nothing new since the array was last written
+                return
+            earlier = []
+            if self.path.exists():
+                with open(self.path, encoding="utf-8") as f:
+                    earlier = json.load(f)
+            tmp = self.path.with_suffix(".json.tmp")
+            with open(jsonl, encoding="utf-8") as src, open(tmp, "w", encoding="utf-8") as dst:
+                items = [json.dumps(row, ensure_ascii=False) for row in earlier]
+                items += (line.rstrip("\n") for line in src if line.strip())
+                dst.write("[\n" + ",\n".join("  " + item for item in items) + "\n]\n")
+            os.replace(tmp, self.path)
+            jsonl.unlink()
+
+
+class Manifest:
+    """Append-only list of finished images, one relative path per line."""
+
+    def __init__(self, path, restart=False):
+        self.path = Path(path)
+        self.done = set()
+        if restart and self.path.exists():
+            self.path.unlink()
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                self.done = {line.rstrip("\n") for line in f if line.strip()}
+        self._f = open(self.path, "a", encoding="utf-8")
+
+    def add(self, keys):
+        for key in keys:
+            self._f.write(key + "\n")
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self):
+        self._f.close()
+
+
+def _eta(seconds):
+    seconds = int(seconds)
+    h, rem = divmod(seconds, 3600)
+    return f"{h}:{rem // 60:02d}:{rem % 60:02d}" if h else f"{rem // 60}:{rem % 60:02d}"
+
+
+def _decode(path):
+    try:
+        return path, to_bgr(path), None
+    except Exception as e:
+        return path, None, e
+
+
+def _prefetch(paths, pool, depth):
+    """Decode `paths` on `pool`, keeping `depth` images in flight, in order."""
+    pending = deque()
+    for path in paths:
+        pending.append(pool.submit(_decode, path))
+        if len(pending) >= depth:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _run_batch(detector, ocr, frames, workers):
+    """[(result, error), ...] for `frames`; a failing batch is retried image by image."""
+    try:
+        return [(r, None) for r in anpr_batch(detector, ocr, frames, workers)]
+    except Exception:
+        pass
+    out = []
+    for frame in frames:
+        try:
+            out.append((anpr_batch(detector, ocr, [frame], 1)[0], None))
+        except Exception as e:
+            out.append((None, e))
+    return out
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 
 def main():
@@ -53,8 +232,17 @@ def main():
     parser = argparse.ArgumentParser(description="Batch ANPR on a folder of images")
     parser.add_argument("folder", help="Path to image folder")
     parser.add_argument("--region", default="univ", help="OCR region (default: univ)")
-    parser.add_argument("--output", default=None, help="Output file (.csv or .json)")
+    parser.add_argument("--output", default=None,
+                        help="Output file (.csv, .jsonl, .json or .parquet)")
     parser.add_argument("--recursive", action="store_true", help="Scan subfolders")
+    parser.add_argument("--batch-size", type=int, default=16, help="Images per anpr_batch call")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Inference threads (default: %(default)s)")
+    parser.add_argument("--decode-workers", type=int, default=4, help="Image decode threads")
+    parser.add_argument("--restart", action="store_true",
+                        help="Ignore the manifest and overwrite the output")
+    parser.add_argument("--quiet", action="store_true", help="Only print progress lines")
+    parser.add_argument("--db", default=None, help="Also write detections to this SQLite history DB")
     args = parser.parse_args()
 
     user_name, serial_key, signature = load_credentials()
@@ -62,22 +250,42 @@ def main():
         print("No credentials. Run: ma-anpr config")
         sys.exit(1)
 
-    if args.recursive:
-        images = sorted(
-            p for p in Path(args.folder).rglob("*")
-            if p.suffix.lower() in EXTENSIONS
-        )
-    else:
-        images = scan_images(args.folder)
-
-    if not images:
+    folder = Path(args.folder)
+    total = sum(1 for _ in scan_images(folder, args.recursive))
+    if not total:
         print(f"No images found in {args.folder}")
         sys.exit(0)
 
-    print(f"Found {len(images)} image(s) in {args.folder}")
+    writer = manifest = None
+    unsynced = []  # finished images whose rows are not on disk yet
+    if args.output:
+        writer = ResultWriter(args.output, restart=args.restart)
+        manifest = Manifest(f"{args.output}.manifest", restart=args.restart)
+    history = None
+    if args.db:
+        from history_writer import HistoryWriter
+        history = HistoryWriter(args.db, on_full="block", block_timeout=None)
+
+    def key(path):
+        return path.relative_to(folder).as_posix()
+
+    # Only manifest entries still in the folder count; deleted or moved
+    # images would otherwise make `todo` too small.
+    skipped = 0
+    if manifest is not None and manifest.done:
+        skipped = sum(1 for p in scan_images(folder, args.recursive) if key(p) in manifest.done)
+    todo = total - skipped
+    paths = (p for p in scan_images(folder, args.recursive)
+             if manifest is None or key(p) not in manifest.done)
+
+    print(f"Found {total} image(s) in {args.folder}")
+    if skipped:
+        print(f"Resuming: {skipped} already done, {todo} to go")
     print(f"Region: {args.region}")
     print("Loading models...")
 
+    from marearts_anpr import ma_anpr_detector_v16, ma_anpr_ocr_v16
+
     detector = ma_anpr_detector_v16(
         "640p_fp32", user_name, serial_key, signature, backend="auto",
     )
@@ -86,48 +294,78 @@ def main():
     )
 
     print("Processing...\n")
-    all_results = []
-    total_plates = 0
+    done = errors = total_plates = 0
     t_start = time.time()
+    last_report = t_start
+    decode_pool = ThreadPoolExecutor(args.decode_workers, thread_name_prefix="anpr-decode")
+    decoded = _prefetch(paths, decode_pool, depth=args.batch_size * 2)
 
-    for i, img_path in enumerate(images, 1):
-        t0 = time.time()
-        try:
-            result = marearts_anpr_from_image_file(detector, ocr, str(img_path))
-            elapsed = time.time() - t0
-            plates = result.get("results", [])
-            total_plates += len(plates)
-            plate_texts = [p["ocr"] for p in plates if p.get("ocr")]
-
-            print(f"  [{i}/{len(images)}] {img_path.name}: "
-                  f"{plate_texts or '(no plates)'}  ({elapsed:.2f}s)")
-
-            for p in plates:
-                all_results.append({
-                    "file": str(img_path.name),
-                    "plate": p.get("ocr", ""),
-                    "ocr_conf": p.get("ocr_conf", 0),
-                    "det_conf": p.get("ltrb_conf", 0),
-                    "bbox": p.get("ltrb", []),
-                })
-        except Exception as e:
-            print(f"  [{i}/{len(images)}] {img_path.name}: ERROR {e}")
+    try:
+        for batch in _batches(decoded, args.batch_size):
+            frames = [(p, f) for p, f, _ in batch if f is not None]
+            results = _run_batch(detector, ocr, [f for _, f in frames], args.workers)
+            by_path = {p: r for (p, _), r in zip(frames, results)}
 
-    total_time = time.time() - t_start
-    print(f"\nDone: {len(images)} images, {total_plates} plates, {total_time:.1f}s total")
+            rows = []
+            ok = []
+            for path, _, err in batch:
+                done += 1
+                result, err = by_path.get(path, (None, err))
+                if err is not None:
+                    errors += 1
+                    print(f"  [{skipped + done}/{total}] {key(path)}: ERROR {err}")
+                    continue
+                ok.append(key(path))
+                plates = result["results"]
+                total_plates += len(plates)
+                if history is not None:
+                    history.submit(result, source=key(path), image=str(path))
+                if not args.quiet:
+                    plate_texts = [p["ocr"] for p in plates if p.get("ocr")]
+                    print(f"  [{skipped + done}/{total}] {key(path)}: "
+                          f"{plate_texts or '(no plates)'}")
+                for p in plates:
+                    rows.append({
+                        "file": key(path),
+                        "plate": p.get("ocr", ""),
+                        "ocr_conf": p.get("ocr_conf", 0),
+                        "det_conf": p.get("ltrb_conf", 0),
+                        "bbox": p.get("ltrb", []),
+                    })
 
-    if args.output:
-        out = Path(args.output)
-        if out.suffix == ".csv":
-            with open(out, "w", newline="") as f:
-                writer = csv.DictWriter(f, fieldnames=["file", "plate", "ocr_conf", "det_conf", "bbox"])
-                writer.writeheader()
-                writer.writerows(all_results)
-            print(f"Saved: {out} ({len(all_results)} rows)")
-        else:
-            with open(out, "w") as f:
-                json.dump(all_results, f, indent=2)
-            print(f"Saved: {out} ({len(all_results)} entries)")
+            if writer is not None:
+                # Rows reach disk before their images enter the manifest: a
+                # crash in between repeats a few rows on resume, never loses any.
+                # Failed images stay out of the manifest and are retried.
+                unsynced.extend(ok)
+                if writer.write(rows):
+                    manifest.add(unsynced)
+                    unsynced = []
+
+            now = time.time()
+            if now - last_report >= 5 or done == todo:
+                rate = done / max(now - t_start, 1e-9)
+                print(f"  -- {skipped + done}/{total} images, {rate:.1f} img/s, "
+                      f"ETA {_eta((todo - done) / max(rate, 1e-9))}")
+                last_report = now
+    except KeyboardInterrupt:
+        print(f"\nInterrupted after {done} image(s); rerun the same command to resume.")
+    finally:
+        decode_pool.shutdown(wait=False, cancel_futures=True)
+        if writer is not None:
+            writer.finish(complete=done == todo)
+            manifest.add(unsynced)
+            manifest.close()
+        if history is not None:
+            history.close()
+
+    total_time = time.time() - t_start
+    print(f"\nDone: {done} images, {total_plates} plates, {errors} errors, "
+          f"{total_time:.1f}s total ({done / max(total_time, 1e-9):.1f} img/s)")
+    if writer is not None:
+        print(f"Saved: {args.output} ({writer.rows} rows this run)")
+    if history is not None:
+        print(f"History: {args.db} ({history.stats()['detections']} detections this run)")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,161 @@
+"""MareArts ANPR — Adaptive Model Cascade
+
+Most frames are easy: a clear, well-lit plate that 320p_int8 finds and int8
+OCR reads with high confidence. AnprCascade runs that cheap tier first and
+escalates only when it is unsure:
+
+- detector: if any box scores below `min_det_conf` (or, with
+  `escalate_empty`, if nothing was found) the frame is re-detected with the
+  accurate detector and its boxes are used instead
+- OCR: a plate read below `min_ocr_conf` is read again with the accurate
+  OCR, and the more confident read wins
+
+Each plate carries `det_tier` and `ocr_tier` ("fast" or "accurate") so you
+can see which model produced it. The accurate models are LazyModels
+(lazy_models.py): they are only built the first time a frame needs them.
+
+    cascade = AnprCascade.from_models(user_name, serial_key, signature)
+    result = cascade.read(frame_bgr)     # marearts_anpr_from_cv2 format + tiers
+    print(cascade.stats())               # escalation rates
+"""
+import threading
+import time
+
+from batch_inference import box_conf, box_ltrb, crop_plate, load_credentials
+from lazy_models import shared_detector, shared_ocr
+
+
+class AnprCascade:
+    """Fast detector + OCR with per-frame / per-plate escalation.
+
+    `accurate_detector` / `accurate_ocr` may be None to cascade only one
+    stage. Confidences use the 0-100 scale of `ltrb_conf` and `ocr_conf`.
+    """
+
+    def __init__(self, fast_detector, fast_ocr, accurate_detector=None, accurate_ocr=None,
+                 min_det_conf=60, min_ocr_conf=90, escalate_empty=False):
+        self.fast_detector = fast_detector
+        self.fast_ocr = fast_ocr
+        self.accurate_detector = accurate_detector
+        self.accurate_ocr = accurate_ocr
+        self.min_det_conf = min_det_conf
+        self.min_ocr_conf = min_ocr_conf
+        self.escalate_empty = escalate_empty
+        self._lock = threading.Lock()
+        self.frames = self.det_escalations = 0
+        self.plates = self.ocr_escalations = 0
+
+    @classmethod
+    def from_models(cls, user_name, serial_key, signature, region="univ", backend="auto",
+                    fast=("320p_int8", "int8"), accurate=("640p_fp32", "fp32"), **kwargs):
+        """Cascade from (detector, OCR) model names; the accurate pair loads lazily."""
+        creds = (user_name, serial_key, signature)
+        return cls(
+            shared_detector(fast[0], *creds, backend=backend),
+            shared_ocr(fast[1], region, *creds, backend=backend),
+            shared_detector(accurate[0], *creds, backend=backend, lazy=True),
+            shared_ocr(accurate[1], region, *creds, backend=backend, lazy=True),
+            **kwargs,
+        )
+
+    def _needs_detector(self, boxes):
+        if self.accurate_detector is None:
+            return False
+        if not boxes:
+            return self.escalate_empty
+        return min(box_conf(b) for b in boxes) < self.min_det_conf
+
+    def read(self, frame_bgr):
+        """Detection + OCR on one BGR frame, escalating where needed."""
+        t0 = time.perf_counter()
+        boxes = self.fast_detector.detector(frame_bgr)
+        det_tier = "fast"
+        if self._needs_detector(boxes):
+            boxes = self.accurate_detector.detector(frame_bgr)
+            det_tier = "accurate"
+        det_sec = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        plates = []
+        ocr_escalations = 0
+        for box in boxes:
+            ltrb = box_ltrb(box)
+            crop = crop_plate(frame_bgr, ltrb)
+            text, conf, ocr_tier = "", 0, "fast"
+            if crop is not None:
+                text, conf = self.fast_ocr.predict(crop)
+                if conf < self.min_ocr_conf and self.accurate_ocr is not None:
+                    ocr_escalations += 1
+                    text2, conf2 = self.accurate_ocr.predict(crop)
+                    if conf2 >= conf:
+                        text, conf, ocr_tier = text2, conf2, "accurate"
+            plates.append({
+                "ocr": text,
+                "ocr_conf": conf,
+                "ltrb": ltrb,
+                "ltrb_conf": box_conf(box),
+                "det_tier": det_tier,
+                "ocr_tier": ocr_tier,
+            })
+        ocr_sec = time.perf_counter() - t0
+
+        with self._lock:
+            self.frames += 1
+            self.det_escalations += det_tier == "accurate"
+            self.plates += len(plates)
+            self.ocr_escalations += ocr_escalations
+        return {
+            "results": plates,
+            "ltrb_proc_sec": round(det_sec, 4),
+            "ocr_proc_sec": round(ocr_sec, 4),
+        }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "frames": self.frames,
+                "det_escalations": self.det_escalations,
+                "det_escalation_rate": round(self.det_escalations / self.frames, 3) if self.frames else 0.0,
+                "plates": self.plates,
+                "ocr_escalations": self.ocr_escalations,
+                "ocr_escalation_rate": round(self.ocr_escalations / self.plates, 3) if self.plates else 0.0,
+            }
+
+
+if __name__ == "__main__":
+    from pathlib import Path
+
+    import numpy as np
+    from PIL import Image
+    from marearts_anpr import marearts_anpr_from_cv2
+
+    user_name, serial_key, signature = load_credentials()
+    if not all([user_name, serial_key, signature]):
+        print("No credentials. Run: ma-anpr config")
+        exit(1)
+
+    SAMPLE = Path(__file__).resolve().parent.parent.parent / "sample_images"
+    paths = sorted(SAMPLE.glob("*.jpg"))
+    frames = [np.array(Image.open(p).convert("RGB"))[:, :, ::-1].copy() for p in paths]
+
+    print("Loading models...")
+    cascade = AnprCascade.from_models(user_name, serial_key, signature, backend="cpu")
+    accurate = (cascade.accurate_detector.get(), cascade.accurate_ocr.get())
+
+    print(f"\n=== 640p_fp32 + fp32 on every frame ({len(frames)} images) ===")
+    t0 = time.perf_counter()
+    reference = [marearts_anpr_from_cv2(*accurate, f) for f in frames]
+    print(f"  {time.perf_counter() - t0:.2f}s")
+
+    print("\n=== Cascade 320p_int8 + int8 → 640p_fp32 + fp32 ===")
+    t0 = time.perf_counter()
+    results = [cascade.read(f) for f in frames]
+    print(f"  {time.perf_counter() - t0:.2f}s  {cascade.stats()}")
+
+    print()
+    for path, ref, res in zip(paths, reference, results):
+        plates = [f"{p['ocr']} ({p['det_tier']}/{p['ocr_tier']})" for p in res["results"]]
+        ref_plates = [p["ocr"] for p in ref["results"]]
+        print(f"  {path.name:<14} {plates or '(no plates)'}   640p: {ref_plates}")
+
+    print("\nDone.")
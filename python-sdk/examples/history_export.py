@@ -0,0 +1,218 @@
+"""MareArts ANPR — Streamed History Export
+
+Exports the history DB written by history_writer.py without building the
+export in memory. Rows are read in keyset chunks (HistorySearch.iter_rows)
+and encoded as they arrive. Memory stays flat and the first bytes go out
+at once, whether the DB holds a thousand plates or fifty million.
+
+- CSV, JSON (one array, written incrementally), JSON Lines, Parquet
+  (one row group per chunk, needs pyarrow)
+- gzip for the text formats, by file suffix (.csv.gz) or gzip=True
+- export_chunks() yields encoded bytes for an HTTP streaming response
+  (FastAPI StreamingResponse, Flask Response, WSGI iterables)
+- `after_id` exports only rows newer than a previous export
+
+    export("history.db", "plates.csv.gz", date_from="2026-04-01")
+    return StreamingResponse(export_chunks(search, "json", gzip=True),
+                             media_type="application/json",
+                             headers={"Content-Encoding": "gzip"})
+
+Usage:
+    python history_export.py history.db plates.csv.gz --date-from 2026-04-01
+    python history_export.py history.db new.jsonl --after-id 1200000
+    python history_export.py history.db - --format csv | head
+"""
+import csv
+import io
+import json
+import sys
+import time
+import zlib
+from pathlib import Path
+
+from history_search import HistorySearch
+from history_writer import MMC_FIELDS
+
+FIELDS = ["id", "detection_id", "timestamp", "source", "image_path", "plate_text",
+          "confidence", "bbox", "detection_confidence", *MMC_FIELDS]
+FORMATS = ("csv", "json", "jsonl", "parquet")
+
+
+def detect_format(path):
+    """(format, gzip) from a file name such as plates.csv.gz."""
+    suffixes = [s.lower().lstrip(".") for s in Path(path).suffixes]
+    gz = bool(suffixes) and suffixes[-1] == "gz"
+    if gz:
+        suffixes.pop()
+    fmt = suffixes[-1] if suffixes else ""
+    fmt = {"ndjson": "jsonl"}.get(fmt, fmt)
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown export format for {path}; use one of {FORMATS}")
+    return fmt, gz
+
+
+def _csv_chunks(rows, chunk_rows):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for i, row in enumerate(rows, 1):
+        writer.writerow({**row, "bbox": json.dumps(row["bbox"]) if row["bbox"] else ""})
+        if i % chunk_rows == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def _json_chunks(rows, chunk_rows, lines):
+    parts = [] if lines else ["["]
+    sep = "\n" if lines else ",\n"
+    first = True
+    for i, row in enumerate(rows, 1):
+        item = json.dumps({k: row[k] for k in FIELDS}, ensure_ascii=False)
+        parts.append(item + "\n" if lines else ("\n" if first else sep) + item)
+        first = False
+        if i % chunk_rows == 0:
+            yield "".join(parts)
+            parts = []
+    if not lines:
+        parts.append("\n]\n" if not first else "]\n")
+    yield "".join(parts)
+
+
+def encode_chunks(rows, fmt, gzip=False, chunk_rows=1000):
+    """Encode an iterable of plate rows as csv / json / jsonl bytes, chunk by chunk."""
+    if fmt not in ("csv", "json", "jsonl"):
+        raise ValueError(f"cannot stream {fmt!r}; use csv, json or jsonl")
+    text = (_csv_chunks(rows, chunk_rows) if fmt == "csv"
+            else _json_chunks(rows, chunk_rows, lines=fmt == "jsonl"))
+    encoder = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None  # wbits 31: gzip header
+    for chunk in text:
+        data = chunk.encode("utf-8")
+        if encoder is not None:
+            data = encoder.compress(data)
+        if data:
+            yield data
+    if encoder is not None:
+        yield encoder.flush()
+
+
+def export_chunks(search, fmt, gzip=False, chunk_rows=1000, **filters):
+    """Yield the export as bytes, `chunk_rows` rows at a time.
+
+    `search` is a HistorySearch; `filters` are those of iter_rows()
+    (q, min_confidence, date_from, date_to, mmc_*, after_id).
+    """
+    rows = search.iter_rows(batch_size=chunk_rows, **filters)
+    return encode_chunks(rows, fmt, gzip, chunk_rows)
+
+
+def _export_parquet(search, path, chunk_rows, filters):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("pip install pyarrow")
+        sys.exit(1)
+
+    schema = pa.schema([("id", pa.int64()), ("detection_id", pa.int64()),
+                        ("timestamp", pa.string()), ("source", pa.string()),
+                        ("image_path", pa.string()), ("plate_text", pa.string()),
+                        ("confidence", pa.float64()), ("bbox", pa.list_(pa.float64())),
+                        ("detection_confidence", pa.float64()),
+                        *((f, pa.string()) for f in MMC_FIELDS)])
+    count = 0
+    batch = []
+    with pq.ParquetWriter(str(path), schema, compression="zstd") as writer:
+        for row in search.iter_rows(batch_size=chunk_rows, **filters):
+            batch.append(row)
+            if len(batch) >= chunk_rows:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                count += len(batch)
+                batch = []
+        if batch or not count:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            count += len(batch)
+    return count
+
+
+def export(db, output, fmt=None, gzip=None, chunk_rows=10000, **filters):
+    """Stream matching plates into `output` (a path, or "-" for stdout). Returns the row count.
+
+    The format and gzip default to what the file name says, each on its
+    own: `fmt="csv"` with "plates.csv.gz" still writes gzip.
+    """
+    if gzip is None:
+        gzip = output != "-" and Path(output).suffix.lower() == ".gz"
+    if fmt is None:
+        fmt, _ = detect_format(output)
+    if fmt == "parquet" and output == "-":
+        raise ValueError("parquet cannot be written to stdout")
+    if fmt == "parquet" and gzip:
+        raise ValueError("parquet is compressed already (zstd); drop gzip / .gz")
+    search = db if isinstance(db, HistorySearch) else HistorySearch(db)
+    try:
+        if fmt == "parquet":
+            return _export_parquet(search, output, chunk_rows, filters)
+
+        count = 0
+
+        def _counted():
+            nonlocal count
+            for row in search.iter_rows(batch_size=chunk_rows, **filters):
+                count += 1
+                yield row
+
+        out = sys.stdout.buffer if output == "-" else open(output, "wb")
+        try:
+            for data in encode_chunks(_counted(), fmt, bool(gzip), chunk_rows):
+                out.write(data)
+        finally:
+            if out is sys.stdout.buffer:
+                out.flush()
+            else:
+                out.close()
+        return count
+    finally:
+        if search is not db:
+            search.close()
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Stream the history DB to CSV / JSON / JSONL / Parquet")
+    parser.add_argument("db", help="History DB (e.g. ~/.marearts/sdk_history.db)")
+    parser.add_argument("output", help="Output file (.csv, .json, .jsonl, .parquet, +.gz) or -")
+    parser.add_argument("--format", choices=FORMATS, default=None, help="Override the file suffix")
+    parser.add_argument("--gzip", action="store_true", help="Compress (implied by .gz)")
+    parser.add_argument("--q", default=None, help="Plate substring")
+    parser.add_argument("--min-confidence", type=float, default=None)
+    parser.add_argument("--date-from", default=None)
+    parser.add_argument("--date-to", default=None)
+    parser.add_argument("--after-id", type=int, default=0, help="Only plates with a larger id")
+    args = parser.parse_args()
+
+    if args.output == "-" and args.format is None:
+        parser.error("--format is required when writing to stdout")
+    if args.output == "-" and args.format == "parquet":
+        parser.error("parquet cannot be written to stdout")
+    if not Path(args.db).expanduser().exists():
+        print(f"No history DB at {args.db}")
+        sys.exit(1)
+
+    t0 = time.perf_counter()
+    try:
+        count = export(args.db, args.output, fmt=args.format, gzip=args.gzip or None,
+                       q=args.q, min_confidence=args.min_confidence, date_from=args.date_from,
+                       date_to=args.date_to, after_id=args.after_id)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.output != "-":
+        elapsed = time.perf_counter() - t0
+        size = Path(args.output).stat().st_size
+        print(f"Exported {count} plates to {args.output} ({size / 1e6:.1f} MB) "
+              f"in {elapsed:.1f}s ({count / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
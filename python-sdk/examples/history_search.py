@@ -0,0 +1,373 @@
+"""MareArts ANPR — Indexed and Fuzzy Plate Search
+
+Substring search with `LIKE '%BG%'` reads every plate row. That is fine
+at 1,000 rows and slow at millions. HistorySearch adds indexes to a
+history DB written by history_writer.py:
+
+- an FTS5 trigram index over plate text. It is kept in sync by triggers,
+  so rows from any writer are indexed as they are committed, and
+  substring queries of 3+ characters use the index instead of a scan.
+  Queries and plates are both matched normalized (upper case, no spaces
+  or hyphens), so "DW724" finds "DW-7244 RV"
+- indexes on detection timestamp, plate confidence and the MMC make /
+  model / color / type columns for the usual filters
+- a fuzzy mode that tolerates OCR misreads. The index also stores each
+  plate with confusable characters folded together (0/O/Q/D, 1/I/L, 8/B,
+  5/S, 2/Z, 6/G). Within distance k a plate keeps at least one of k + 1
+  pieces of the folded query intact, so rows containing one of those
+  pieces are the candidates. They are ranked by an edit distance where
+  swapping confusable characters costs CONFUSION_COST instead of 1.
+  Queries too short to cut into pieces of 3+ characters scan every plate
+  of a plausible length instead (slower, never incomplete)
+- keyset pagination (page()) and chunked iteration (iter_rows()) that
+  stay fast however deep they go; history_export.py streams exports
+  on top of iter_rows()
+
+    search = HistorySearch("history.db")
+    search.search("BG24")                               # substring, newest first
+    search.search("BG2417PR", fuzzy=1)                  # "8G24I7PR" matches at 0.5
+    search.search(min_confidence=90, date_from="2026-04-01", mmc_make="Toyota")
+    page = search.page(limit=100)                       # {"items", "next_cursor"}
+    page = search.page(limit=100, cursor=page["next_cursor"])
+
+Usage:
+    python history_search.py history.db BG2417PR --fuzzy 1
+    python history_search.py bench.db --generate 1000000    # synthetic rows to try it on
+"""
+import heapq
+import json
+import sqlite3
+import time
+
+from history_writer import DEFAULT_DB, MMC_FIELDS, connect
+
+CONFUSION_GROUPS = ("0OQD", "1IL", "8B", "5S", "2Z", "6G")
+CONFUSION_COST = 0.25
+MMC_FILTERS = ("mmc_make", "mmc_model", "mmc_color", "mmc_type")
+
+_FOLD = {c: group[0] for group in CONFUSION_GROUPS for c in group[1:]}
+_GROUP = {c: group for group in CONFUSION_GROUPS for c in group}
+
+
+def normalize(text):
+    """Upper-case ASCII, drop spaces and hyphens (as SQLite UPPER/REPLACE do)."""
+    return "".join(c.upper() if c.isascii() else c for c in text if c not in " -")
+
+
+def canonical(text):
+    """normalize() with confusable characters folded to one representative."""
+    return "".join(_FOLD.get(c, c) for c in normalize(text))
+
+
+def _normalized_sql(expr):
+    expr = f"UPPER({expr})"
+    for c in " -":
+        expr = f"REPLACE({expr}, '{c}', '')"
+    return expr
+
+
+def _canonical_sql(expr):
+    expr = _normalized_sql(expr)
+    for c, rep in _FOLD.items():
+        expr = f"REPLACE({expr}, '{c}', '{rep}')"
+    return expr
+
+
+def substitution_cost(a, b):
+    if a == b:
+        return 0.0
+    return CONFUSION_COST if b in _GROUP.get(a, "") else 1.0
+
+
+def weighted_distance(a, b, limit=None):
+    """Edit distance between normalized plates; confusable swaps are cheap.
+
+    Returns a value above `limit` (not necessarily exact) as soon as the
+    distance is known to exceed it.
+    """
+    if limit is not None and abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev = [float(j) for j in range(len(b) + 1)]
+    for i, ca in enumerate(a, 1):
+        cur = [float(i)]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + substitution_cost(ca, cb)))
+        if limit is not None and min(cur) > limit:
+            return limit + 1
+        prev = cur
+    return prev[-1]
+
+
+def trigrams(key):
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+
+def has_trigram_fts(db):
+    try:
+        db.execute("CREATE VIRTUAL TABLE temp._trigram_probe USING fts5(x, tokenize='trigram')")
+        db.execute("DROP TABLE temp._trigram_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def ensure_index(db):
+    """Create the search indexes (idempotent). Returns True if the trigram index exists."""
+    with db:
+        db.execute("CREATE INDEX IF NOT EXISTS idx_detections_timestamp ON detections(timestamp)")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_plates_confidence ON plates(confidence)")
+        for field in MMC_FILTERS:
+            db.execute(f"CREATE INDEX IF NOT EXISTS idx_plates_{field} "
+                       f"ON plates({field} COLLATE NOCASE)")
+    exists = db.execute("SELECT 1 FROM sqlite_master WHERE name = 'plate_index'").fetchone()
+    if exists:
+        columns = {row[1] for row in db.execute("PRAGMA table_info(plate_index)")}
+        if "plate_norm" in columns:
+            return True
+    if not has_trigram_fts(db):
+        return False
+    norm, key = _normalized_sql("new.plate_text"), _canonical_sql("new.plate_text")
+    with db:
+        if exists:
+            # Built before plate_norm existed: rebuild it with the column.
+            db.execute("DROP TRIGGER IF EXISTS plates_index_insert")
+            db.execute("DROP TRIGGER IF EXISTS plates_index_delete")
+            db.execute("DROP TABLE plate_index")
+        db.execute("CREATE VIRTUAL TABLE plate_index USING fts5("
+                   "plate_text, plate_norm, plate_key, tokenize='trigram')")
+        db.execute(f"INSERT INTO plate_index(rowid, plate_text, plate_norm, plate_key) "
+                   f"SELECT id, plate_text, {_normalized_sql('plate_text')}, "
+                   f"{_canonical_sql('plate_text')} FROM plates")
+        db.execute(f"CREATE TRIGGER IF NOT EXISTS plates_index_insert AFTER INSERT ON plates BEGIN "
+                   f"INSERT INTO plate_index(rowid, plate_text, plate_norm, plate_key) "
+                   f"VALUES (new.id, new.plate_text, {norm}, {key}); END")
+        db.execute("CREATE TRIGGER IF NOT EXISTS plates_index_delete AFTER DELETE ON plates BEGIN "
+                   "DELETE FROM plate_index WHERE rowid = old.id; END")
+    return True
+
+
+class HistorySearch:
+    """Search plates in a history DB. Creates the indexes on first use.
+
+    Without an SQLite build that has the FTS5 trigram tokenizer (3.34+),
+    searches fall back to scans with the same results.
+    """
+
+    COLUMNS = ("p.id", "p.detection_id", "d.timestamp", "d.source", "d.image_path",
+               "p.plate_text", "p.confidence", "p.bbox", "p.detection_confidence",
+               *(f"p.{f}" for f in MMC_FIELDS))
+
+    def __init__(self, path=DEFAULT_DB):
+        self.db = connect(path)
+        self.fts = ensure_index(self.db)
+        self._names = [c.split(".")[1] for c in self.COLUMNS]
+
+    def close(self):
+        self.db.close()
+
+    def _row(self, row):
+        out = dict(zip(self._names, row))
+        if out["bbox"]:
+            out["bbox"] = json.loads(out["bbox"])
+        return out
+
+    def _filters(self, min_confidence, date_from, date_to, mmc):
+        where, params = [], []
+        if min_confidence is not None:
+            where.append("p.confidence >= ?")
+            params.append(min_confidence)
+        if date_from:
+            where.append("d.timestamp >= ?")
+            params.append(date_from)
+        if date_to:
+            # A bare date includes that whole day.
+            where.append("d.timestamp < ?" if "T" in date_to else "d.timestamp < date(?, '+1 day')")
+            params.append(date_to)
+        for field, value in mmc.items():
+            if field not in MMC_FILTERS:
+                raise ValueError(f"unknown filter {field!r}; use one of {MMC_FILTERS}")
+            where.append(f"p.{field} = ? COLLATE NOCASE")
+            params.append(value)
+        return where, params
+
+    def _select(self, where, params, limit, order="DESC"):
+        sql = (f"SELECT {', '.join(self.COLUMNS)} FROM plates p "
+               f"JOIN detections d ON d.id = p.detection_id "
+               f"{'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY p.id {order}")
+        if limit is not None:
+            sql += " LIMIT ?"
+            params = [*params, limit]
+        return self.db.execute(sql, params)
+
+    def _conditions(self, q=None, min_confidence=None, date_from=None, date_to=None, **mmc):
+        where, params = self._filters(min_confidence, date_from, date_to, mmc)
+        if q:
+            q = normalize(q)
+            if self.fts and len(q) >= 3:
+                where.insert(0, "p.id IN (SELECT rowid FROM plate_index WHERE plate_norm LIKE ?)")
+            else:
+                where.insert(0, f"{_normalized_sql('p.plate_text')} LIKE ?")
+            params.insert(0, f"%{q}%")
+        return where, params
+
+    def search(self, q=None, fuzzy=0, min_confidence=None, date_from=None, date_to=None,
+               limit=50, before_id=None, **mmc):
+        """Plates matching `q` (substring) and the filters, newest first.
+
+        With `fuzzy` > 0, `q` is a whole plate and rows within that weighted
+        edit distance are returned, closest first, with a "distance" field.
+        `before_id` continues a newest-first listing below that plate id.
+        """
+        if q and fuzzy:
+            if before_id is not None:
+                raise ValueError("fuzzy results are ranked by distance and cannot be paged by id")
+            where, params = self._filters(min_confidence, date_from, date_to, mmc)
+            return self._fuzzy(q, fuzzy, where, params, limit)
+        where, params = self._conditions(q, min_confidence, date_from, date_to, **mmc)
+        if before_id is not None:
+            where.append("p.id < ?")
+            params.append(before_id)
+        return [self._row(r) for r in self._select(where, params, limit)]
+
+    def page(self, limit=50, cursor=None, **filters):
+        """One page of search() results and the cursor for the next page.
+
+        Keyset pagination: each page is an index seek below the previous
+        page's last id, so page 10,000 costs the same as page 1 (limit /
+        offset reads and discards every earlier row). Rows inserted while
+        paging do not shift later pages.
+        """
+        items = self.search(limit=limit, before_id=cursor, **filters)
+        return {"items": items, "next_cursor": items[-1]["id"] if len(items) == limit else None}
+
+    def iter_rows(self, batch_size=1000, after_id=0, **filters):
+        """Every matching plate, oldest first, read in keyset chunks.
+
+        Each chunk is its own short query, so memory stays at one chunk and
+        a long export never holds a WAL read snapshot that would stop
+        checkpoints. `after_id` resumes (or increments) an earlier export.
+        """
+        where, params = self._conditions(**filters)
+        where.append("p.id > ?")
+        while True:
+            rows = self._select(where, [*params, after_id], batch_size, order="ASC").fetchall()
+            for row in rows:
+                yield self._row(row)
+            if len(rows) < batch_size:
+                return
+            after_id = rows[-1][0]
+
+    def _fuzzy(self, q, fuzzy, where, params, limit):
+        q = normalize(q)
+        key = canonical(q)
+        grams = trigrams(key)
+        # Confusable swaps leave the folded key alone and every other edit
+        # costs 1, so a match has at most `edits` edits in folded form. Each
+        # touches at most 3 trigrams, and at most one of `edits` + 1 pieces.
+        edits = int(fuzzy)
+        need = len(grams) - 3 * edits
+        pieces = _pieces(key, edits + 1)
+        where, params = list(where), list(params)
+        if self.fts and pieces and min(map(len, pieces)) >= 3:
+            match = "plate_key : (" + " OR ".join('"' + p.replace('"', '""') + '"' for p in pieces) + ")"
+            where.insert(0, "p.id IN (SELECT rowid FROM plate_index WHERE plate_index MATCH ?)")
+            params.insert(0, match)
+        elif pieces:
+            # Pieces too short for the trigram index: the same test on every row.
+            test = " OR ".join("instr(plate_key, ?) > 0" for _ in pieces)
+            if self.fts:
+                where.insert(0, f"p.id IN (SELECT rowid FROM plate_index WHERE {test})")
+            else:
+                where.insert(0, "(" + test.replace("plate_key", _canonical_sql("p.plate_text")) + ")")
+            params[:0] = pieces
+        where.append("length(p.plate_text) BETWEEN ? AND ?")
+        params += [max(len(q) - edits, 1), len(q) + edits + 2]  # + room for spaces / hyphens
+
+        # Every candidate is scored as the cursor streams; only the best `limit` are kept.
+        scored = []
+        for row in self._select(where, params, None):
+            text = normalize(row[5])
+            folded = canonical(text)
+            if pieces and not any(p in folded for p in pieces):
+                continue
+            if need > 0 and len(grams & trigrams(folded)) < need:
+                continue
+            d = weighted_distance(q, text, fuzzy)
+            if d <= fuzzy:
+                scored.append((d, -row[0], row))
+                if limit is not None and len(scored) >= 2 * limit + 1000:
+                    scored = heapq.nsmallest(limit, scored, key=lambda s: s[:2])
+        scored.sort(key=lambda s: s[:2])
+        return [{**self._row(r), "distance": round(d, 3)} for d, _, r in scored[:limit]]
+
+
+def _pieces(key, n):
+    """`key` cut into `n` non-empty pieces of near-equal length ([] if it is too short)."""
+    if n > len(key):
+        return []
+    bounds = [round(i * len(key) / n) for i in range(n + 1)]
+    return [key[a:b] for a, b in zip(bounds, bounds[1:])]
+
+
+def _generate(path, n):
+    import random
+
+    from history_writer import HistoryWriter
+
+    letters, digits = "ABCDEFGHJKLMNPRSTUVWXYZ", "0123456789"
+    makes = ("Toyota", "Hyundai", "Ford", "BMW", "Kia", "Honda")
+    colors = ("white", "black", "silver", "red", "blue")
+    rng = random.Random(0)
+    t0 = time.perf_counter()
+    with HistoryWriter(path, on_full="block", block_timeout=None, batch_size=5000) as history:
+        for i in range(n):
+            text = ("".join(rng.choices(letters, k=2)) + "".join(rng.choices(digits, k=4))
+                    + "".join(rng.choices(letters, k=2)))
+            day = 1 + i * 28 // n
+            history.submit({"results": [{
+                "plate_text": text, "confidence": round(rng.uniform(60, 100), 1),
+                "bbox": [0, 0, 10, 10], "detection_confidence": 90.0,
+                "mmc_make": rng.choice(makes), "mmc_color": rng.choice(colors),
+            }]}, source="synthetic", timestamp=f"2026-04-{day:02d}T12:00:00")
+    print(f"Generated {n} rows in {time.perf_counter() - t0:.1f}s")
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Search plates in a history DB")
+    parser.add_argument("db", nargs="?", default=str(DEFAULT_DB), help="History DB")
+    parser.add_argument("q", nargs="?", default=None, help="Plate text or substring")
+    parser.add_argument("--fuzzy", type=float, default=0,
+                        help="Max weighted edit distance (confusable swaps cost 0.25)")
+    parser.add_argument("--min-confidence", type=float, default=None)
+    parser.add_argument("--date-from", default=None)
+    parser.add_argument("--date-to", default=None)
+    parser.add_argument("--make", default=None)
+    parser.add_argument("--color", default=None)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--generate", type=int, default=0, metavar="N",
+                        help="First add N synthetic plates (for benchmarking)")
+    args = parser.parse_args()
+
+    if args.generate:
+        _generate(args.db, args.generate)
+
+    t0 = time.perf_counter()
+    search = HistorySearch(args.db)
+    print(f"Index: {'FTS5 trigram' if search.fts else 'none (scan)'}  "
+          f"(opened in {(time.perf_counter() - t0) * 1000:.0f} ms)")
+    mmc = {k: v for k, v in (("mmc_make", args.make), ("mmc_color", args.color)) if v}
+    t0 = time.perf_counter()
+    rows = search.search(args.q, fuzzy=args.fuzzy, min_confidence=args.min_confidence,
+                         date_from=args.date_from, date_to=args.date_to, limit=args.limit, **mmc)
+    ms = (time.perf_counter() - t0) * 1000
+    for r in rows:
+        extra = f"  d={r['distance']}" if "distance" in r else ""
+        print(f"  #{r['id']:<8} {r['timestamp']}  {r['plate_text']:<12} {r['confidence'] or 0:5.1f}"
+              f"  {r['mmc_make'] or '':<8} {r['mmc_color'] or '':<7}{extra}")
+    print(f"{len(rows)} result(s) in {ms:.1f} ms")
+    search.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,490 @@
+"""MareArts ANPR — Write-Behind Detection History
+
+Committing one SQLite row per detection on the thread that ran the models
+puts an fsync in every request. At a few hundred detections per second
+those commits, not the models, set the tail latency. HistoryWriter moves
+persistence off the request path:
+
+- submit() only puts the result on a bounded queue and returns
+- a dedicated writer thread groups detection, plate and alert rows into
+  one transaction per batch (up to `batch_size` items or `flush_interval`
+  seconds, whichever comes first)
+- the database runs in WAL mode with synchronous=NORMAL, so readers never
+  block the writer and a commit does not fsync the main file
+- under backpressure it degrades instead of blocking: above half full,
+  image saves are skipped; when full, new items are dropped and counted.
+  With on_full="block" the caller waits up to `block_timeout` first
+  (None waits as long as it takes, for batch jobs that must not lose rows)
+- watchlist matching and image encoding run on the writer thread too
+
+    with HistoryWriter("history.db", match=lambda text: watch.get(text, [])) as history:
+        result = marearts_anpr_from_cv2(detector, ocr, frame)
+        history.submit(result, source="cam1", image=jpeg_bytes)
+    print(history.stats())
+
+Row ids are read from the tables inside each write transaction, so
+several writers (a live service and a batch_folder.py --db run) can share
+one file. Point it at its own file, not at the server's
+~/.marearts/server_history.db, which has a different schema.
+"""
+import json
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+from pathlib import Path
+
+from tracing import span
+
+DEFAULT_DB = Path.home() / ".marearts" / "sdk_history.db"
+MMC_FIELDS = ("mmc_make", "mmc_model", "mmc_color", "mmc_type",
+              "mmc_plate", "mmc_plate_nation", "mmc_vehicle_side")
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    source TEXT,
+    image_path TEXT,
+    processing_sec REAL,
+    plate_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS plates (
+    id INTEGER PRIMARY KEY,
+    detection_id INTEGER NOT NULL,
+    plate_text TEXT NOT NULL DEFAULT '',
+    confidence REAL,
+    bbox TEXT,
+    detection_confidence REAL,
+    {", ".join(f"{f} TEXT" for f in MMC_FIELDS)}
+);
+CREATE INDEX IF NOT EXISTS idx_plates_detection ON plates(detection_id);
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY,
+    detection_id INTEGER NOT NULL,
+    plate_id INTEGER NOT NULL,
+    plate_text TEXT NOT NULL,
+    watch TEXT NOT NULL,
+    label TEXT,
+    timestamp TEXT NOT NULL,
+    read INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_alerts_detection ON alerts(detection_id);
+CREATE INDEX IF NOT EXISTS idx_alerts_watch ON alerts(watch);
+"""
+
+
+def connect(path=DEFAULT_DB, readonly=False):
+    """SQLite connection with the pragmas used for the history DB."""
+    path = Path(path).expanduser()
+    if readonly:
+        db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    else:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(path), check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("PRAGMA busy_timeout=5000")
+    return db
+
+
+def plate_fields(plate):
+    """(text, confidence, bbox, detection_confidence) from SDK or server plate dicts."""
+    return (
+        plate.get("plate_text", plate.get("ocr", "")) or "",
+        plate.get("confidence", plate.get("ocr_conf")),
+        plate.get("bbox", plate.get("ltrb")),
+        plate.get("detection_confidence", plate.get("ltrb_conf")),
+    )
+
+
+class _Flush:
+    __slots__ = ("event",)
+
+    def __init__(self):
+        self.event = threading.Event()
+
+
+class _Alerts:
+    __slots__ = ("rows",)
+
+    def __init__(self, rows):
+        self.rows = rows
+
+
+_STOP = object()
+
+
+class HistoryWriter:
+    """Queue detection results and persist them in batches on a writer thread.
+
+    `match(plate_text)` returns [(watch, label, ...), ...] watchlist hits
+    (a watchlist.Watchlist fits); each becomes an alert row in the same
+    transaction as its plate. Set `image_dir` to keep the frames passed to
+    submit() (encoded JPEG bytes or a BGR array); a path passed as `image`
+    is recorded as-is. `max_history` keeps only the newest N detections.
+    Pass a tracing.Tracer to record each flush as a trace. With `index`
+    the search indexes of history_search.py are created up front and kept
+    current as rows are written.
+    """
+
+    def __init__(self, path=DEFAULT_DB, max_queue=10000, batch_size=500, flush_interval=0.2,
+                 on_full="drop", block_timeout=0.05, match=None, image_dir=None,
+                 max_history=None, tracer=None, index=True):
+        if on_full not in ("drop", "block"):
+            raise ValueError("on_full must be 'drop' or 'block'")
+        self.path = Path(path).expanduser()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_full = on_full
+        self.block_timeout = block_timeout
+        self.match = match
+        self.image_dir = Path(image_dir).expanduser() if image_dir else None
+        self.max_history = max_history
+        self.tracer = tracer
+        self._queue = queue.Queue(max_queue)
+        self._shed_images_at = max_queue // 2
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(
+            ("submitted", "dropped", "images_skipped", "detections", "plates", "alerts",
+             "images", "flushes", "failed"), 0)
+        self._flush_ms = []
+        self.last_error = None
+
+        self._db = connect(self.path)
+        self._db.executescript(SCHEMA)
+        if index:
+            from history_search import ensure_index
+            ensure_index(self._db)
+        self._thread = threading.Thread(target=self._run, name="anpr-history-writer", daemon=True)
+        self._thread.start()
+
+    # ---- request path -------------------------------------------------
+    def submit(self, result, source=None, image=None, timestamp=None):
+        """Queue one ANPR result. Returns False if it was dropped.
+
+        Results are refused (dropped) once the writer thread has stopped,
+        after close() or a crash, instead of queueing where nothing reads.
+        """
+        if not self._thread.is_alive():
+            with self._lock:
+                self._counts["dropped"] += 1
+            return False
+        if not isinstance(image, (str, Path)):
+            if self.image_dir is None:
+                image = None
+            elif image is not None and self._queue.qsize() >= self._shed_images_at:
+                image = None
+                with self._lock:
+                    self._counts["images_skipped"] += 1
+        item = (timestamp or time.strftime("%Y-%m-%dT%H:%M:%S"), source, result, image)
+        try:
+            if self.on_full == "block":
+                self._queue.put(item, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self._counts["dropped"] += 1
+            return False
+        with self._lock:
+            self._counts["submitted"] += 1
+        return True
+
+    def submit_alerts(self, alerts):
+        """Queue alert rows for plates already in the DB (retroactive watchlist hits).
+
+        Each alert is a dict with detection_id, plate_id, plate_text, watch,
+        label and timestamp. Waits for queue space: this is not a request path.
+        """
+        alerts = list(alerts)
+        if not self._thread.is_alive():
+            raise RuntimeError("history writer is not running")
+        if alerts:
+            self._queue.put(_Alerts(alerts))
+        return len(alerts)
+
+    def flush(self, timeout=None):
+        """Block until everything submitted so far is committed (or has failed).
+
+        Returns False on timeout or when the writer thread is not running.
+        """
+        if not self._thread.is_alive():
+            return False
+        marker = _Flush()
+        self._queue.put(marker)
+        return marker.event.wait(timeout)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self):
+        with self._lock:
+            times = sorted(self._flush_ms)
+            out = dict(self._counts, queued=self._queue.qsize())
+        if times:
+            out["flush_ms_p50"] = round(times[len(times) // 2], 2)
+            out["flush_ms_max"] = round(times[-1], 2)
+        return out
+
+    # ---- writer thread ------------------------------------------------
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                batch = [self._queue.get(timeout=1.0)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is _STOP
+            items = [b for b in batch if isinstance(b, tuple)]
+            extra = [a for b in batch if isinstance(b, _Alerts) for a in b.rows]
+            try:
+                if items or extra:
+                    self._write(items, extra)
+            finally:
+                for b in batch:
+                    if isinstance(b, _Flush):
+                        b.event.set()
+
+    def _write(self, items, extra_alerts=()):
+        t0 = time.perf_counter()
+        ctx = self.tracer.trace("history_flush", items=len(items)) if self.tracer else nullcontext()
+        rows, alerts = [], []
+        failed = 0
+        written = (0, 0, 0, 0)
+        with ctx:
+            # A malformed result or a failing match() costs only its own item.
+            for item in items:
+                try:
+                    rows.append(self._prepare(*item))
+                except Exception as e:
+                    self.last_error = repr(e)
+                    failed += 1
+            for a in extra_alerts:
+                try:
+                    alerts.append((a["detection_id"], a["plate_id"], a["plate_text"],
+                                   a["watch"], a.get("label"), a["timestamp"]))
+                except (KeyError, TypeError) as e:
+                    self.last_error = repr(e)
+                    failed += 1
+            try:
+                written = self._insert(rows, alerts)
+            except sqlite3.Error as e:
+                # Find the rows SQLite rejects instead of dropping the whole batch.
+                self.last_error = repr(e)
+                written = [0, 0, 0, 0]
+                for one_row, one_alert in [([r], []) for r in rows] + [([], [a]) for a in alerts]:
+                    try:
+                        counts = self._insert(one_row, one_alert)
+                    except sqlite3.Error as e:
+                        self.last_error = repr(e)
+                        failed += 1
+                        self._discard_images(one_row)
+                    else:
+                        written = [w + c for w, c in zip(written, counts)]
+
+        ms = (time.perf_counter() - t0) * 1000
+        with self._lock:
+            c = self._counts
+            c["flushes"] += 1
+            c["detections"] += written[0]
+            c["plates"] += written[1]
+            c["alerts"] += written[2]
+            c["images"] += written[3]
+            c["failed"] += failed
+            self._flush_ms.append(ms)
+            del self._flush_ms[:-1000]
+
+    def _prepare(self, timestamp, source, result, image):
+        """Row values for one submitted result; raises on a malformed result."""
+        results = result.get("results", [])
+        if not isinstance(results, (list, tuple)):
+            raise TypeError(f"result['results'] must be a list, not {type(results).__name__}")
+        plates = []
+        for p in results:
+            text, conf, bbox, det_conf = plate_fields(p)
+            hits = []
+            if self.match is not None and text:
+                with span("watchlist_match"):
+                    hits = [(hit[0], hit[1]) for hit in self.match(text)]  # (watch, label, ...)
+            plates.append(((text, conf, None if bbox is None else json.dumps(list(bbox)), det_conf,
+                            *(p.get(f) for f in MMC_FIELDS)), hits))
+        image_path, saved = None, False
+        if isinstance(image, (str, Path)):
+            image_path = str(image)
+        elif image is not None:
+            with span("image_save"):
+                image_path = self._save_image(timestamp, image)
+            saved = image_path is not None
+        return (timestamp, None if source is None else str(source), image_path,
+                result.get("processing_sec"), plates, saved)
+
+    def _insert(self, rows, alerts):
+        """Insert prepared rows and alerts in one transaction.
+
+        Returns the number of (detections, plates, alerts, saved images) written.
+        """
+        detections, plates, alert_rows = [], [], []
+        with span("db_insert", detections=len(rows)):
+            with self._db:
+                # BEGIN IMMEDIATE takes the write lock before the ids are read,
+                # so another writer cannot claim them in between.
+                self._db.execute("BEGIN IMMEDIATE")
+                det_id, plate_id, alert_id = (
+                    self._db.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {t}").fetchone()[0]
+                    for t in ("detections", "plates", "alerts"))
+                for a in alerts:
+                    alert_rows.append((alert_id, *a))
+                    alert_id += 1
+                for timestamp, source, image_path, processing_sec, det_plates, _ in rows:
+                    detections.append((det_id, timestamp, source, image_path, processing_sec,
+                                       len(det_plates)))
+                    for values, hits in det_plates:
+                        plates.append((plate_id, det_id, *values))
+                        for watch, label in hits:
+                            alert_rows.append((alert_id, det_id, plate_id, values[0], watch,
+                                               label, timestamp))
+                            alert_id += 1
+                        plate_id += 1
+                    det_id += 1
+                self._db.executemany(
+                    "INSERT INTO detections VALUES (?, ?, ?, ?, ?, ?)", detections)
+                self._db.executemany(
+                    f"INSERT INTO plates VALUES ({', '.join('?' * (6 + len(MMC_FIELDS)))})",
+                    plates)
+                self._db.executemany(
+                    "INSERT INTO alerts (id, detection_id, plate_id, plate_text, watch, "
+                    "label, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)", alert_rows)
+                pruned = []
+                if self.max_history:
+                    with span("prune"):
+                        pruned = self._prune(det_id - 1 - self.max_history)
+        for path in pruned:
+            Path(path).unlink(missing_ok=True)
+        return len(detections), len(plates), len(alert_rows), sum(r[5] for r in rows)
+
+    def _prune(self, cutoff):
+        """Delete detections up to `cutoff`; returns the image files this writer saved for them."""
+        if cutoff <= 0:
+            return []
+        images = []
+        if self.image_dir is not None:
+            prefix = str(self.image_dir)
+            images = [path for (path,) in self._db.execute(
+                "SELECT image_path FROM detections WHERE id <= ? AND image_path IS NOT NULL",
+                (cutoff,)) if path.startswith(prefix)]
+        self._db.execute("DELETE FROM alerts WHERE detection_id <= ?", (cutoff,))
+        self._db.execute("DELETE FROM plates WHERE detection_id <= ?", (cutoff,))
+        self._db.execute("DELETE FROM detections WHERE id <= ?", (cutoff,))
+        return images
+
+    def _discard_images(self, rows):
+        for row in rows:
+            if row[5]:
+                Path(row[2]).unlink(missing_ok=True)
+
+    def _save_image(self, timestamp, image):
+        # Named before the row has an id (ids are taken inside the transaction).
+        folder = self.image_dir / timestamp[:10]
+        folder.mkdir(parents=True, exist_ok=True)
+        path = folder / f"{uuid.uuid4().hex}.jpg"
+        try:
+            if isinstance(image, (bytes, bytearray, memoryview)):
+                path.write_bytes(image)
+            else:
+                from PIL import Image
+                Image.fromarray(image[:, :, ::-1]).save(path, quality=90)
+        except (OSError, ValueError, TypeError) as e:
+            self.last_error = repr(e)
+            return None
+        return str(path)
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    import numpy as np
+    from batch_inference import anpr_batch, load_credentials
+    from pipeline import to_bgr
+
+    user_name, serial_key, signature = load_credentials()
+    if not all([user_name, serial_key, signature]):
+        print("No credentials. Run: ma-anpr config")
+        exit(1)
+
+    from marearts_anpr import ma_anpr_detector_v16, ma_anpr_ocr_v16
+
+    SAMPLE = Path(__file__).resolve().parent.parent.parent / "sample_images"
+    paths = sorted(SAMPLE.glob("*.jpg"))
+
+    print("Loading models...")
+    detector = ma_anpr_detector_v16(
+        "640p_fp32", user_name, serial_key, signature, backend="cpu",
+    )
+    ocr = ma_anpr_ocr_v16(
+        "fp32", "univ", user_name, serial_key, signature, backend="cpu",
+    )
+    results = anpr_batch(detector, ocr, [to_bgr(p) for p in paths])
+    plates = [p["ocr"] for r in results for p in r["results"] if p["ocr"]]
+    watch = {plates[0]: [(plates[0], "demo watch")]} if plates else {}
+    N = 3000
+
+    def _summary(label, waits):
+        waits = np.asarray(waits) * 1000
+        print(f"  {label}: p50 {np.percentile(waits, 50):.3f} ms  "
+              f"p99 {np.percentile(waits, 99):.3f} ms  max {waits.max():.3f} ms per detection")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"\n=== Synchronous: one commit per detection ({N} detections) ===")
+        db = sqlite3.connect(str(Path(tmp) / "sync.db"))
+        db.executescript(SCHEMA)
+        waits = []
+        for i in range(N):
+            r = results[i % len(results)]
+            t0 = time.perf_counter()
+            with db:
+                det_id = db.execute("INSERT INTO detections (timestamp, source, plate_count) "
+                                    "VALUES (?, ?, ?)", (time.strftime("%Y-%m-%dT%H:%M:%S"),
+                                                         paths[i % len(paths)].name,
+                                                         len(r["results"]))).lastrowid
+                for p in r["results"]:
+                    text, conf, bbox, det_conf = plate_fields(p)
+                    db.execute("INSERT INTO plates (detection_id, plate_text, confidence, bbox, "
+                               "detection_confidence) VALUES (?, ?, ?, ?, ?)",
+                               (det_id, text, conf, json.dumps(bbox), det_conf))
+            waits.append(time.perf_counter() - t0)
+        db.close()
+        _summary("sync ", waits)
+
+        print(f"\n=== Write-behind HistoryWriter ({N} detections) ===")
+        waits = []
+        with HistoryWriter(Path(tmp) / "history.db", match=lambda t: watch.get(t, [])) as history:
+            for i in range(N):
+                t0 = time.perf_counter()
+                history.submit(results[i % len(results)], source=paths[i % len(paths)].name)
+                waits.append(time.perf_counter() - t0)
+            history.flush()
+            _summary("queue", waits)
+            print(f"  {history.stats()}")
+
+    print("\nDone.")
@@ -0,0 +1,150 @@
+"""MareArts ANPR — Lazy and Shared Model Loading
+
+Model loading takes seconds; inference takes milliseconds. This example
+keeps that cost off the startup path:
+
+- LazyModel builds a detector/OCR only on first use (or in the background
+  with warm()), so a process that starts and never reads a plate, or a
+  CLI call that fails early, never pays for it.
+- shared_detector() / shared_ocr() return one instance per
+  (package version, credentials, model, region, backend) for the whole
+  process, so reloading code paths reuse the already-built session. A
+  caller with other credentials gets its own instance, never one built
+  under someone else's license.
+
+The downloaded model files themselves are already cached by the package
+under ~/.marearts; sessions are built from them in memory.
+"""
+import hashlib
+import threading
+import time
+
+from batch_inference import load_credentials
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+class LazyModel:
+    """Proxy that calls `factory(*args, **kwargs)` on first use.
+
+    Attribute access (`detector.detector(...)`, `ocr.predict(...)`) is
+    forwarded to the built model. The marearts_anpr_from_* functions
+    tell detector from OCR by type, so pass them `lazy.get()`.
+    """
+
+    def __init__(self, factory, *args, **kwargs):
+        self._factory = factory
+        self._args = args
+        self._kwargs = kwargs
+        self._model = None
+        self._lock = threading.Lock()
+        self.load_sec = None
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def get(self):
+        """Build the model once (thread-safe) and return it."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    t0 = time.perf_counter()
+                    self._model = self._factory(*self._args, **self._kwargs)
+                    self.load_sec = time.perf_counter() - t0
+        return self._model
+
+    def warm(self):
+        """Start building in a background thread; returns the thread."""
+        def _build():
+            try:
+                self.get()
+            except Exception:
+                pass  # retried, and raised, by the next get()
+
+        t = threading.Thread(target=_build, name="anpr-warm", daemon=True)
+        t.start()
+        return t
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+
+def _credentials(user_name, serial_key, signature):
+    """Digest of the credentials, so shared-model keys never hold the secrets."""
+    return hashlib.sha256(f"{user_name}\0{serial_key}\0{signature}".encode()).hexdigest()
+
+
+def _shared_model(key, factory, args, kwargs, lazy):
+    import marearts_anpr
+
+    key = (marearts_anpr.__version__,) + key
+    with _shared_lock:
+        model = _shared.get(key)
+        if model is None:
+            model = LazyModel(factory, *args, **kwargs)
+            _shared[key] = model
+    return model if lazy else model.get()
+
+
+def shared_detector(model_name, user_name, serial_key, signature, backend="auto",
+                    lazy=False, **kwargs):
+    """Process-wide ma_anpr_detector_v16; `lazy=True` returns a LazyModel."""
+    from marearts_anpr import ma_anpr_detector_v16
+
+    key = ("detector_v16", _credentials(user_name, serial_key, signature), model_name, backend,
+           tuple(sorted(kwargs.items())))
+    return _shared_model(key, ma_anpr_detector_v16,
+                         (model_name, user_name, serial_key, signature),
+                         dict(backend=backend, **kwargs), lazy)
+
+
+def shared_ocr(model_name, region, user_name, serial_key, signature, backend="auto",
+               lazy=False):
+    """Process-wide ma_anpr_ocr_v16; `lazy=True` returns a LazyModel."""
+    from marearts_anpr import ma_anpr_ocr_v16, normalize_region_alias
+
+    key = ("ocr_v16", _credentials(user_name, serial_key, signature), model_name,
+           normalize_region_alias(region) or region, backend)
+    return _shared_model(key, ma_anpr_ocr_v16,
+                         (model_name, region, user_name, serial_key, signature),
+                         dict(backend=backend), lazy)
+
+
+if __name__ == "__main__":
+    from pathlib import Path
+
+    from marearts_anpr import marearts_anpr_from_image_file
+
+    user_name, serial_key, signature = load_credentials()
+    if not all([user_name, serial_key, signature]):
+        print("No credentials. Run: ma-anpr config")
+        exit(1)
+
+    IMG = str(Path(__file__).resolve().parent.parent.parent / "sample_images" / "eu-a.jpg")
+
+    print("=== Lazy: start-up returns immediately ===")
+    t0 = time.perf_counter()
+    detector = shared_detector("640p_fp32", user_name, serial_key, signature, lazy=True)
+    ocr = shared_ocr("fp32", "univ", user_name, serial_key, signature, lazy=True)
+    print(f"  created in {time.perf_counter() - t0:.4f}s  (loaded: {detector.loaded}, {ocr.loaded})")
+
+    print("\n=== Warm in the background while doing other start-up work ===")
+    threads = [detector.warm(), ocr.warm()]
+    time.sleep(0.1)  # ... parse config, open sockets, etc.
+    for t in threads:
+        t.join()
+    print(f"  detector built in {detector.load_sec:.2f}s, OCR in {ocr.load_sec:.2f}s")
+
+    result = marearts_anpr_from_image_file(detector.get(), ocr.get(), IMG)
+    print(f"  plates: {[r['ocr'] for r in result['results']]}")
+
+    print("\n=== Shared: asking again reuses the same sessions ===")
+    t0 = time.perf_counter()
+    again = shared_detector("640p_fp32", user_name, serial_key, signature)
+    print(f"  {time.perf_counter() - t0:.4f}s  (same object: {again is detector.get()})")
+
+    print("\nDone.")
@@ -0,0 +1,463 @@
+"""MareArts ANPR — Prometheus / OpenMetrics Sidecar
+
+A small reverse proxy that sits in front of `ma-anpr server` and serves a
+scrapeable `/metrics` page. Clients talk to the proxy instead of the
+server; every request is forwarded unchanged and timed. For ANPR responses
+the timing fields are turned into per-stage histograms:
+
+- anpr_stage_seconds{stage="total|detector|ocr|mmc_request|mmc_model|other"}
+  from processing_sec, detector_sec, ocr_sec, mmc_*_sec; "other" is what
+  the server spent outside the models (decode, DB write, image save)
+- anpr_request_seconds{endpoint} as seen by clients, and
+  anpr_server_wait_seconds{endpoint}: client time not covered by
+  processing_sec (upload parsing, waiting for a worker thread)
+- anpr_requests_total{endpoint,method,code} and
+  anpr_plates_total{endpoint,region,detector_model,ocr_model}
+
+A background poller adds gauges from /api/threads (pool size, busy
+workers, queue), numeric fields of /api/health/check (memory and the
+like), the active models and region, and the size of the history DB.
+
+With --slow-ms, every ANPR request slower than the threshold is kept as a
+span tree (client upload, upstream wait, the server's detector / OCR / MMC /
+other stages, relay) and listed at /api/debug/slow (see tracing.py).
+
+Usage:
+    python metrics_proxy.py --upstream http://127.0.0.1:8000 --listen 0.0.0.0:9100
+    python metrics_proxy.py --slow-ms 500      # also keep slow-request traces
+    curl http://127.0.0.1:9100/metrics
+    curl -X POST http://127.0.0.1:9100/api/anpr -F "image=@car.jpg"   # proxied
+"""
+import http.client
+import json
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from tracing import Tracer, debug_response, span
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0, 30.0)
+STAGES = (("total", "processing_sec"), ("detector", "detector_sec"), ("ocr", "ocr_sec"),
+          ("mmc_request", "mmc_request_sec"), ("mmc_model", "mmc_model_sec"))
+HOP_HEADERS = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+               "te", "trailers", "transfer-encoding", "upgrade", "host"}
+DEFAULT_DB = Path.home() / ".marearts" / "server_history.db"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.values = defaultdict(float)
+
+    def inc(self, *label_values, amount=1.0):
+        self.values[label_values] += amount
+
+    def render(self):
+        lines = [f"# TYPE {self.name} counter", f"# HELP {self.name} {self.help}"]
+        for lv, v in sorted(self.values.items()):
+            lines.append(f"{self.name}_total{_labels(self.labels, lv)} {v:g}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.values = {}
+
+    def set(self, value, *label_values):
+        self.values[label_values] = float(value)
+
+    def render(self):
+        lines = [f"# TYPE {self.name} gauge", f"# HELP {self.name} {self.help}"]
+        for lv, v in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, lv)} {v:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observe(self, value, *label_values):
+        s = self.series.get(label_values)
+        if s is None:
+            s = self.series[label_values] = [[0] * len(self.buckets), 0, 0.0]
+        for i, edge in enumerate(self.buckets):
+            if value <= edge:
+                s[0][i] += 1
+        s[1] += 1
+        s[2] += value
+
+    def render(self):
+        lines = [f"# TYPE {self.name} histogram", f"# HELP {self.name} {self.help}",
+                 f"# UNIT {self.name} seconds"]
+        for lv, (counts, count, total) in sorted(self.series.items()):
+            for edge, c in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), lv + (repr(edge),))} {c}")
+            lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), lv + ('+Inf',))} {count}")
+            lines.append(f"{self.name}_count{_labels(self.labels, lv)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, lv)} {total:.6f}")
+        return lines
+
+
+class AnprMetrics:
+    """All metrics of the sidecar, guarded by one lock."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter("anpr_requests", "Proxied requests", ("endpoint", "method", "code"))
+        self.plates = Counter("anpr_plates", "Plates returned",
+                              ("endpoint", "region", "detector_model", "ocr_model"))
+        self.mmc_errors = Counter("anpr_mmc_errors", "Responses carrying mmc_error", ("endpoint",))
+        self.upstream_errors = Counter("anpr_upstream_errors", "Upstream connection failures")
+        self.request_seconds = Histogram("anpr_request_seconds",
+                                         "Request latency seen by clients", ("endpoint",))
+        self.wait_seconds = Histogram("anpr_server_wait_seconds",
+                                      "Client latency not covered by processing_sec", ("endpoint",))
+        self.stage_seconds = Histogram("anpr_stage_seconds",
+                                       "Server-reported time per stage", ("stage", "endpoint"))
+        self.threads = Gauge("anpr_threads", "Numeric fields of GET /api/threads", ("field",))
+        self.health = Gauge("anpr_health", "Numeric fields of GET /api/health/check", ("field",))
+        self.info = Gauge("anpr_model", "Active models and region (value is always 1)",
+                          ("detector_model", "ocr_model", "region", "backend"))
+        self.db_bytes = Gauge("anpr_history_db_bytes", "Size of the history DB and its WAL", ("file",))
+        self.up = Gauge("anpr_up", "1 if the last upstream poll succeeded")
+        self.active = {"region": "unknown", "detector_model": "unknown", "ocr_model": "unknown"}
+
+    def render(self):
+        with self.lock:
+            lines = []
+            for m in (self.requests, self.plates, self.mmc_errors, self.upstream_errors,
+                      self.request_seconds, self.wait_seconds, self.stage_seconds,
+                      self.threads, self.health, self.info, self.db_bytes, self.up):
+                lines.extend(m.render())
+        return "\n".join(lines) + "\n# EOF\n"
+
+    def observe_request(self, endpoint, method, code, elapsed, body, region=None):
+        data = None
+        if endpoint.startswith("/api/anpr") and code < 400:
+            try:
+                data = json.loads(body)
+            except ValueError:
+                pass
+        with self.lock:
+            self.requests.inc(endpoint, method, str(code))
+            self.request_seconds.observe(elapsed, endpoint)
+            for item in data if isinstance(data, list) else [data]:
+                self._observe_result(endpoint, item, elapsed, region)
+        return data
+
+    def _observe_result(self, endpoint, data, elapsed, region):
+        if not isinstance(data, dict):
+            return
+        # Batch responses nest one result per image.
+        for nested in data.get("results", []) if "processing_sec" not in data else []:
+            if isinstance(nested, dict) and "processing_sec" in nested:
+                self._observe_result(endpoint, nested, elapsed, region)
+        if "processing_sec" not in data:
+            return
+        stages = {}
+        for stage, field in STAGES:
+            value = data.get(field)
+            if isinstance(value, (int, float)):
+                stages[stage] = float(value)
+                self.stage_seconds.observe(float(value), stage, endpoint)
+        total = stages.get("total", 0.0)
+        other = total - sum(v for k, v in stages.items() if k in ("detector", "ocr", "mmc_request"))
+        self.stage_seconds.observe(max(other, 0.0), "other", endpoint)
+        if "batch" not in endpoint:
+            self.wait_seconds.observe(max(elapsed - total, 0.0), endpoint)
+        if "mmc_error" in data:
+            self.mmc_errors.inc(endpoint)
+        plates = len(data.get("results", []))
+        if plates:
+            self.plates.inc(endpoint, region or self.active["region"],
+                            self.active["detector_model"], self.active["ocr_model"],
+                            amount=plates)
+
+
+def _flatten(prefix, obj, out):
+    if isinstance(obj, bool):
+        out[prefix] = int(obj)
+    elif isinstance(obj, (int, float)):
+        out[prefix] = obj
+    elif isinstance(obj, dict):
+        for k, v in obj.items():
+            _flatten(f"{prefix}_{k}" if prefix else str(k), v, out)
+    return out
+
+
+def normalize_endpoint(path):
+    """Collapse ids and file names so label cardinality stays bounded."""
+    path = urlsplit(path).path
+    if path.startswith("/api/images/"):
+        return "/api/images/{filename}"
+    return re.sub(r"/\d+(?=/|$)", "/{id}", path)
+
+
+class Poller(threading.Thread):
+    def __init__(self, upstream, metrics, interval, db_path):
+        super().__init__(name="anpr-metrics-poll", daemon=True)
+        self.upstream, self.metrics, self.interval, self.db_path = upstream, metrics, interval, db_path
+
+    def _get(self, path):
+        conn = http.client.HTTPConnection(self.upstream.hostname, self.upstream.port or 80, timeout=5)
+        try:
+            conn.request("GET", path)
+            r = conn.getresponse()
+            return json.loads(r.read()) if r.status == 200 else None
+        finally:
+            conn.close()
+
+    def poll(self):
+        try:
+            threads = self._get("/api/threads") or {}
+            health = self._get("/api/health/check") or {}
+            config = self._get("/api/config") or {}
+            region = self._get("/api/region") or {}
+            ok = True
+        except (OSError, ValueError):
+            threads = health = config = region = {}
+            ok = False
+        models = config.get("models", {}) if isinstance(config, dict) else {}
+        with self.metrics.lock:
+            self.metrics.up.set(1 if ok else 0)
+            for field, v in _flatten("", threads, {}).items():
+                self.metrics.threads.set(v, field)
+            for field, v in _flatten("", health, {}).items():
+                self.metrics.health.set(v, field)
+            if models or region:
+                active = {
+                    "region": region.get("active_region") or models.get("region") or "unknown",
+                    "detector_model": models.get("detector_model", "unknown"),
+                    "ocr_model": models.get("ocr_model", "unknown"),
+                }
+                if active != self.metrics.active:
+                    self.metrics.info.values.clear()
+                self.metrics.active = active
+                self.metrics.info.set(1, active["detector_model"], active["ocr_model"],
+                                      active["region"], models.get("backend", "unknown"))
+            for suffix in ("", "-wal"):
+                f = Path(f"{self.db_path}{suffix}")
+                if f.exists():
+                    self.metrics.db_bytes.set(f.stat().st_size, f.name)
+
+    def run(self):
+        while True:
+            self.poll()
+            time.sleep(self.interval)
+
+
+_MULTIPART_REGION = re.compile(rb'name="region"\r\n(?:[^\r\n]+\r\n)*\r\n([^\r\n]*)\r\n')
+_JSON_REGION = re.compile(rb'"region"\s*:\s*"([^"]*)"')
+
+
+def request_region(path, content_type, body):
+    """Per-request OCR region from the query string or the form / JSON body, else None."""
+    region = parse_qs(urlsplit(path).query).get("region", [None])[0]
+    if region or not body:
+        return region
+    content_type = (content_type or "").lower()
+    if content_type.startswith("multipart/form-data"):
+        match = _MULTIPART_REGION.search(body)
+    elif content_type.startswith("application/x-www-form-urlencoded"):
+        return parse_qs(body.decode("latin-1")).get("region", [None])[0]
+    elif "json" in content_type:
+        match = _JSON_REGION.search(body)
+    else:
+        return None
+    return match.group(1).decode("utf-8", "replace") if match else None
+
+
+def _server_spans(upstream_span, data):
+    """Lay the server's own stage times out under the upstream span."""
+    total = data.get("processing_sec")
+    if not isinstance(total, (int, float)):
+        return
+    server = upstream_span.record("server", total)
+    known = 0.0
+    for stage, field in STAGES[1:]:
+        value = data.get(field)
+        if stage == "mmc_model" or not isinstance(value, (int, float)):
+            continue
+        child = server.record(stage, value)
+        known += value
+        if stage == "mmc_request" and isinstance(data.get("mmc_model_sec"), (int, float)):
+            child.record("mmc_model", data["mmc_model_sec"])
+    # Decode, DB insert, image save and watchlist match are not reported separately.
+    server.record("other", max(total - known, 0.0))
+    if "mmc_error" in data:
+        server.attrs["mmc_error"] = data["mmc_error"]
+    # The time after "server" within upstream is transfer plus waiting for a worker.
+    upstream_span.attrs["wait_ms"] = round(max(upstream_span.duration_ms - total * 1000, 0.0), 3)
+
+
+def make_handler(upstream, metrics, tracer=None):
+    local = threading.local()
+
+    def _conn():
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection(
+                upstream.hostname, upstream.port or 80, timeout=300)
+        return conn
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _metrics(self):
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type",
+                             "application/openmetrics-text; version=1.0.0; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _debug(self):
+            code, body, content_type = (debug_response(tracer, None, self.path)
+                                        or (404, {"detail": "not found"}, "application/json"))
+            data = body.encode() if isinstance(body, str) else json.dumps(body, indent=2).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _forward(self):
+            if self.command == "GET" and self.path.split("?")[0] == "/metrics":
+                return self._metrics()
+            if tracer is not None and self.path.startswith("/api/debug/"):
+                return self._debug()
+            endpoint = normalize_endpoint(self.path)
+            traced = tracer is not None and endpoint.startswith("/api/anpr")
+            with tracer.trace(f"{self.command} {endpoint}") if traced else nullcontext() as root:
+                self._relay(endpoint, root)
+
+        def _relay(self, endpoint, root):
+            with span("client_upload"):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else None
+            headers = {k: v for k, v in self.headers.items() if k.lower() not in HOP_HEADERS}
+            region = request_region(self.path, self.headers.get("Content-Type"), body)
+
+            t0 = time.perf_counter()
+            try:
+                with span("upstream") as upstream_span:
+                    conn = _conn()
+                    reused = conn.sock is not None
+                    try:
+                        conn.request(self.command, self.path, body=body, headers=headers)
+                        resp = conn.getresponse()
+                    except (http.client.RemoteDisconnected, BrokenPipeError,
+                            ConnectionResetError):
+                        # The upstream closed an idle keep-alive connection before
+                        # answering, so it never saw the request: retry once on a new
+                        # one. Timeouts and other errors are not retried, since the
+                        # upstream may already have run inference.
+                        if not reused:
+                            raise
+                        conn.close()
+                        conn.request(self.command, self.path, body=body, headers=headers)
+                        resp = conn.getresponse()
+            except (http.client.HTTPException, OSError) as e:
+                if getattr(local, "conn", None) is not None:
+                    local.conn.close()
+                local.conn = None
+                with metrics.lock:
+                    metrics.upstream_errors.inc()
+                self.send_error(502, f"upstream unavailable: {e!r}")
+                return
+
+            self.send_response(resp.status, resp.reason)
+            for k, v in resp.getheaders():
+                if k.lower() not in HOP_HEADERS:
+                    self.send_header(k, v)
+            if resp.getheader("Content-Length") is None:
+                # Streaming response (e.g. /api/events): relay until upstream closes.
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                local.conn = None
+                try:
+                    while True:
+                        chunk = resp.read1(65536) if hasattr(resp, "read1") else resp.read(65536)
+                        if not chunk:
+                            break
+                        self.wfile.write(chunk)
+                        self.wfile.flush()
+                finally:
+                    conn.close()
+                data = b""
+            else:
+                with span("relay"):
+                    self.end_headers()
+                    data = resp.read()
+                    self.wfile.write(data)
+            result = metrics.observe_request(endpoint, self.command, resp.status,
+                                             time.perf_counter() - t0, data, region)
+            if root is not None:
+                root.attrs.update(code=resp.status, bytes_in=len(body or b""))
+                if region:
+                    root.attrs["region"] = region
+                if isinstance(result, dict):
+                    _server_spans(upstream_span, result)
+
+        do_GET = do_POST = do_PUT = do_DELETE = do_PATCH = _forward
+
+    return Handler
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="OpenMetrics sidecar / proxy for ma-anpr server")
+    parser.add_argument("--upstream", default="http://127.0.0.1:8000", help="ANPR server URL")
+    parser.add_argument("--listen", default="0.0.0.0:9100", help="host:port to serve on")
+    parser.add_argument("--poll", type=float, default=5.0, help="Seconds between upstream polls")
+    parser.add_argument("--db", default=str(DEFAULT_DB), help="History DB to report the size of")
+    parser.add_argument("--slow-ms", type=float, default=None,
+                        help="Keep span trees of ANPR requests slower than this (/api/debug/slow)")
+    parser.add_argument("--slow-keep", type=int, default=200, help="Slow traces to keep")
+    args = parser.parse_args()
+
+    upstream = urlsplit(args.upstream)
+    host, _, port = args.listen.rpartition(":")
+    metrics = AnprMetrics()
+    Poller(upstream, metrics, args.poll, args.db).start()
+
+    tracer = Tracer(args.slow_ms, args.slow_keep) if args.slow_ms is not None else None
+
+    server = ThreadingHTTPServer((host or "0.0.0.0", int(port)),
+                                 make_handler(upstream, metrics, tracer))
+    server.daemon_threads = True
+    print(f"Proxying {args.upstream} on http://{args.listen}  (metrics: /metrics)")
+    if tracer is not None:
+        print(f"Slow requests (>= {args.slow_ms:g} ms): http://{args.listen}/api/debug/slow")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
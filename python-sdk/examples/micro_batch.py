@@ -0,0 +1,201 @@
+"""MareArts ANPR — Dynamic Micro-Batching
+
+MicroBatcher sits between many concurrent callers (HTTP handlers, camera
+threads) and one detector/OCR pair. It takes up to `max_batch_size`
+waiting requests, runs them through one anpr_batch() call, and hands
+every caller its own result. While a batch runs, new requests queue up,
+so batches grow under load and stay at one frame when traffic is light.
+
+Batching here only buys thread fan-in: anpr_batch maps single-image
+model calls over a thread pool (see batch_inference.py), so grouping
+saves pool hand-offs and bounds the number of frames in flight. It does
+not cut per-call model overhead. Waiting for a batch to fill therefore
+only adds latency, and `max_wait_ms` defaults to 0 (take what is
+already queued). A frame that makes the batch fail is retried alone, so
+only its own caller gets the exception.
+
+    batcher = MicroBatcher(detector, ocr, max_batch_size=8)
+    result = batcher.submit(frame_bgr).result()    # from any thread
+    print(batcher.stats())                         # achieved batch sizes
+"""
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+from batch_inference import DEFAULT_WORKERS, anpr_batch, load_credentials
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """Collect concurrent submit() calls into batches for anpr_batch()."""
+
+    def __init__(self, detector, ocr, max_batch_size=8, max_wait_ms=0,
+                 workers=DEFAULT_WORKERS):
+        self.detector = detector
+        self.ocr = ocr
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.workers = workers
+        self._inbox = queue.Queue()
+        self._lock = threading.Lock()
+        self._sizes = Counter()
+        self._wait_sec = 0.0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="anpr-micro-batch", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame_bgr):
+        """Queue one BGR frame; returns a Future for its result dict."""
+        future = Future()
+        # Checked and queued under the lock close() takes, so nothing lands
+        # behind the stop marker.
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("batcher is closed")
+            self._inbox.put((frame_bgr, future, time.perf_counter()))
+        return future
+
+    def _collect(self):
+        """Block for the first request, then gather more until full or timed out."""
+        first = self._inbox.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._inbox.get(timeout=remaining) if remaining > 0 else self._inbox.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._inbox.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            batch = [b for b in batch if b[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            results = self._run_batch([frame for frame, _, _ in batch])
+            with self._lock:
+                self._sizes[len(batch)] += 1
+                self._wait_sec += sum(started - t for _, _, t in batch)
+            for (_, future, _), (result, error) in zip(batch, results):
+                if error is not None:
+                    future.set_exception(error)
+                    continue
+                result["batch_size"] = len(batch)
+                future.set_result(result)
+
+    def _run_batch(self, frames):
+        """[(result, error), ...] for `frames`; a failing batch is retried frame by frame."""
+        try:
+            return [(r, None) for r in anpr_batch(self.detector, self.ocr, frames, self.workers)]
+        except Exception as e:
+            if len(frames) == 1:
+                return [(None, e)]
+        out = []
+        for frame in frames:
+            try:
+                out.append((anpr_batch(self.detector, self.ocr, [frame], 1)[0], None))
+            except Exception as e:
+                out.append((None, e))
+        return out
+
+    def stats(self):
+        """Batch-size histogram and averages since start."""
+        with self._lock:
+            batches = sum(self._sizes.values())
+            frames = sum(size * n for size, n in self._sizes.items())
+            return {
+                "batches": batches,
+                "frames": frames,
+                "avg_batch_size": round(frames / batches, 2) if batches else 0.0,
+                "max_batch_size": max(self._sizes) if self._sizes else 0,
+                "batch_sizes": dict(sorted(self._sizes.items())),
+                "avg_queue_wait_ms": round(self._wait_sec / frames * 1000, 2) if frames else 0.0,
+                "queue_depth": self._inbox.qsize(),
+            }
+
+    def close(self):
+        """Process everything already submitted, then stop."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._inbox.put(_STOP)
+        self._thread.join()
+        while True:
+            try:
+                item = self._inbox.get_nowait()
+            except queue.Empty:
+                return
+            if item is not _STOP and item[1].set_running_or_notify_cancel():
+                item[1].set_exception(RuntimeError("batcher is closed"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    import numpy as np
+    from PIL import Image
+    from marearts_anpr import (
+        ma_anpr_detector_v16,
+        ma_anpr_ocr_v16,
+        marearts_anpr_from_cv2,
+    )
+
+    user_name, serial_key, signature = load_credentials()
+    if not all([user_name, serial_key, signature]):
+        print("No credentials. Run: ma-anpr config")
+        exit(1)
+
+    SAMPLE = Path(__file__).resolve().parent.parent.parent / "sample_images"
+    frames = [np.array(Image.open(p).convert("RGB"))[:, :, ::-1].copy()
+              for p in sorted(SAMPLE.glob("plate_*.jpg"))] * 5
+    CLIENTS = 16
+
+    print("Loading models...")
+    detector = ma_anpr_detector_v16(
+        "320p_fp32", user_name, serial_key, signature, backend="cpu",
+    )
+    ocr = ma_anpr_ocr_v16(
+        "fp32", "univ", user_name, serial_key, signature, backend="cpu",
+    )
+
+    print(f"\n=== {CLIENTS} concurrent clients, one call each ({len(frames)} requests) ===")
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(CLIENTS) as clients:
+        list(clients.map(lambda f: marearts_anpr_from_cv2(detector, ocr, f), frames))
+    elapsed = time.perf_counter() - t0
+    print(f"  {elapsed:.2f}s  ({len(frames) / elapsed:.1f} req/s)")
+
+    for max_wait_ms in (0, 5):
+        print(f"\n=== {CLIENTS} concurrent clients via MicroBatcher "
+              f"(max_batch_size=8, max_wait_ms={max_wait_ms}) ===")
+        with MicroBatcher(detector, ocr, max_batch_size=8, max_wait_ms=max_wait_ms) as batcher:
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(CLIENTS) as clients:
+                list(clients.map(lambda f: batcher.submit(f).result(), frames))
+            elapsed = time.perf_counter() - t0
+            stats = batcher.stats()
+        print(f"  {elapsed:.2f}s  ({len(frames) / elapsed:.1f} req/s)")
+        print(f"  batches={stats['batches']} avg size={stats['avg_batch_size']} "
+              f"sizes={stats['batch_sizes']} avg wait={stats['avg_queue_wait_ms']}ms")
+
+    print("\nDone.")
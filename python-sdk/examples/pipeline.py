@@ -0,0 +1,276 @@
+"""MareArts ANPR — Pipelined Detect → OCR
+
+AnprPipeline runs decode, detection and OCR as three thread stages
+connected by bounded queues, so frame N+1 is being detected while the
+plates of frame N are being read. Use it when throughput matters more
+than the latency of a single image (camera ingest, archives).
+
+    with AnprPipeline(detector, ocr, workers=2) as pipe:
+        future = pipe.submit("car.jpg")        # path, bytes, PIL or BGR array
+        result = future.result()               # marearts_anpr_from_cv2 format
+        for result in pipe.map(frames):        # results in input order
+            ...
+        print(pipe.stats())                    # queue depth + latency per stage
+"""
+import io
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from batch_inference import box_conf, box_ltrb, crop_plate, load_credentials
+
+_STOP = object()
+
+
+class _Job:
+    __slots__ = ("source", "future", "frame", "boxes", "result", "t_submit")
+
+    def __init__(self, source):
+        self.source = source
+        self.future = Future()
+        self.frame = None
+        self.boxes = None
+        self.result = None
+        self.t_submit = time.perf_counter()
+
+
+class _Stage:
+    """One pipeline stage: `workers` threads moving jobs from inbox to outbox."""
+
+    def __init__(self, name, fn, inbox, outbox, workers):
+        self.name = name
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self.count = 0
+        self.errors = 0
+        self.total_sec = 0.0
+        self.max_sec = 0.0
+        self._lock = threading.Lock()
+        self.threads = [
+            threading.Thread(target=self._loop, name=f"anpr-{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for t in self.threads:
+            t.start()
+
+    def _loop(self):
+        while True:
+            job = self.inbox.get()
+            if job is _STOP:
+                return
+            t0 = time.perf_counter()
+            try:
+                self.fn(job)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+                continue
+            dt = time.perf_counter() - t0
+            with self._lock:
+                self.count += 1
+                self.total_sec += dt
+                self.max_sec = max(self.max_sec, dt)
+            if self.outbox is not None:
+                self.outbox.put(job)
+            else:
+                job.future.set_result(job.result)
+
+    def stop(self):
+        for _ in self.threads:
+            self.inbox.put(_STOP)
+        for t in self.threads:
+            t.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": len(self.threads),
+                "queue_depth": self.inbox.qsize(),
+                "processed": self.count,
+                "errors": self.errors,
+                "avg_sec": round(self.total_sec / self.count, 4) if self.count else 0.0,
+                "max_sec": round(self.max_sec, 4),
+            }
+
+
+def to_bgr(source):
+    """Decode a path, encoded bytes, PIL image or BGR array into a BGR array."""
+    if isinstance(source, np.ndarray):
+        return source
+    if isinstance(source, (str, Path)):
+        source = Image.open(source)
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        source = Image.open(io.BytesIO(source))
+    return np.array(source.convert("RGB"))[:, :, ::-1].copy()
+
+
+class AnprPipeline:
+    """Decode → detect → OCR pipeline with bounded queues between stages.
+
+    `workers` sets the thread count of the detector and OCR stages (an int
+    for both, or a (detect, ocr) tuple). `queue_size` bounds every queue,
+    so submit() blocks instead of buffering without limit when the models
+    fall behind.
+    """
+
+    def __init__(self, detector, ocr, workers=1, decode_workers=2, queue_size=8):
+        if isinstance(workers, int):
+            workers = (workers, workers)
+        self.detector = detector
+        self.ocr = ocr
+        self.queue_size = queue_size
+        self._latency_lock = threading.Lock()
+        self._done = 0
+        self._total_latency = 0.0
+        self._closed = False
+        self._submit_lock = threading.Lock()
+
+        decode_q = queue.Queue(queue_size)
+        detect_q = queue.Queue(queue_size)
+        ocr_q = queue.Queue(queue_size)
+        self._stages = [
+            _Stage("decode", self._decode, decode_q, detect_q, decode_workers),
+            _Stage("detect", self._detect, detect_q, ocr_q, workers[0]),
+            _Stage("ocr", self._ocr, ocr_q, None, workers[1]),
+        ]
+
+    # ── stages ──
+    def _decode(self, job):
+        if not job.future.set_running_or_notify_cancel():
+            raise RuntimeError("cancelled")
+        job.frame = to_bgr(job.source)
+        job.source = None
+
+    def _detect(self, job):
+        t0 = time.perf_counter()
+        job.boxes = self.detector.detector(job.frame)
+        job.result = {"results": [], "ltrb_proc_sec": round(time.perf_counter() - t0, 4)}
+
+    def _ocr(self, job):
+        t0 = time.perf_counter()
+        for box in job.boxes:
+            ltrb = box_ltrb(box)
+            text, conf = "", 0
+            if self.ocr is not None:
+                crop = crop_plate(job.frame, ltrb)
+                if crop is not None:
+                    text, conf = self.ocr.predict(crop)
+            job.result["results"].append({
+                "ocr": text,
+                "ocr_conf": conf,
+                "ltrb": ltrb,
+                "ltrb_conf": box_conf(box),
+            })
+        job.result["ocr_proc_sec"] = round(time.perf_counter() - t0, 4)
+        job.frame = None
+
+        latency = time.perf_counter() - job.t_submit
+        with self._latency_lock:
+            self._done += 1
+            self._total_latency += latency
+
+    # ── public API ──
+    def submit(self, frame):
+        """Queue one image; returns a Future resolving to the result dict."""
+        job = _Job(frame)
+        # Checked and queued under the lock close() takes, so nothing lands
+        # behind the stop markers.
+        with self._submit_lock:
+            if self._closed:
+                raise RuntimeError("pipeline is closed")
+            self._stages[0].inbox.put(job)
+        return job.future
+
+    def map(self, frames):
+        """Yield results for `frames` in input order, keeping the stages busy."""
+        window = self.queue_size * len(self._stages)
+        pending = deque()
+        for frame in frames:
+            pending.append(self.submit(frame))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def stats(self):
+        """Per-stage queue depth and latency, plus end-to-end latency."""
+        with self._latency_lock:
+            done, total = self._done, self._total_latency
+        return {
+            "stages": {s.name: s.stats() for s in self._stages},
+            "completed": done,
+            "avg_latency_sec": round(total / done, 4) if done else 0.0,
+        }
+
+    def close(self):
+        """Drain every queued frame, then stop the stage threads."""
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+        for stage in self._stages:
+            stage.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    from marearts_anpr import (
+        ma_anpr_detector_v16,
+        ma_anpr_ocr_v16,
+        marearts_anpr_from_image_file,
+    )
+
+    user_name, serial_key, signature = load_credentials()
+    if not all([user_name, serial_key, signature]):
+        print("No credentials. Run: ma-anpr config")
+        exit(1)
+
+    SAMPLE = Path(__file__).resolve().parent.parent.parent / "sample_images"
+    paths = sorted(SAMPLE.glob("plate_*.jpg")) * 3
+
+    print("Loading models...")
+    detector = ma_anpr_detector_v16(
+        "320p_fp32", user_name, serial_key, signature, backend="cpu",
+    )
+    ocr = ma_anpr_ocr_v16(
+        "fp32", "univ", user_name, serial_key, signature, backend="cpu",
+    )
+
+    print(f"\n=== Sequential ({len(paths)} images) ===")
+    t0 = time.perf_counter()
+    for p in paths:
+        marearts_anpr_from_image_file(detector, ocr, str(p))
+    elapsed = time.perf_counter() - t0
+    print(f"  {elapsed:.3f}s  ({len(paths) / elapsed:.1f} img/s)")
+
+    print(f"\n=== AnprPipeline ({len(paths)} images) ===")
+    with AnprPipeline(detector, ocr, workers=2) as pipe:
+        t0 = time.perf_counter()
+        for p, result in zip(paths, pipe.map(paths)):
+            plates = [r["ocr"] for r in result["results"]]
+            print(f"  {p.name}: {plates or '(no plates)'}")
+        elapsed = time.perf_counter() - t0
+        print(f"  {elapsed:.3f}s  ({len(paths) / elapsed:.1f} img/s)")
+
+        print("\n=== Stage stats ===")
+        stats = pipe.stats()
+        for name, s in stats["stages"].items():
+            print(f"  {name:<7} workers={s['workers']} queue={s['queue_depth']} "
+                  f"done={s['processed']} avg={s['avg_sec']:.4f}s max={s['max_sec']:.4f}s")
+        print(f"  end-to-end avg latency: {stats['avg_latency_sec']:.4f}s")
+
+    print("\nDone.")
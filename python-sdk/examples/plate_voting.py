@@ -0,0 +1,122 @@
+"""MareArts ANPR — Per-Track OCR Voting
+
+PlateVote merges the OCR reads of one vehicle seen over several frames
+(video) or shots (burst uploads) into a single consensus plate. Reads vote
+first on plate length, then per character, weighted by OCR confidence.
+Once the consensus confidence passes `threshold`, `done` turns True and
+the caller can stop running OCR for that vehicle and emit one final read.
+
+video_stream.py uses it for every track. Run this file on a burst of shots
+of the same scene:
+
+    python plate_voting.py shot1.jpg shot2.jpg shot3.jpg
+"""
+import sys
+from collections import defaultdict
+
+from batch_inference import load_credentials
+
+
+class PlateVote:
+    """Confidence-weighted character voting over the reads of one plate.
+
+    `prior` is a pseudo-weight of doubt added to every position, so one
+    read alone never reaches full confidence and agreeing reads raise it
+    step by step. `max_reads` caps OCR calls for plates that never agree.
+    """
+
+    def __init__(self, threshold=90, min_reads=2, max_reads=8, prior=0.15):
+        self.threshold = threshold
+        self.min_reads = min_reads
+        self.max_reads = max_reads
+        self.prior = prior
+        self.reads = []
+        self._lengths = defaultdict(float)
+
+    def add(self, text, conf):
+        text = (text or "").strip()
+        self.reads.append((text, conf))
+        if text:
+            self._lengths[len(text)] += conf / 100.0
+
+    def consensus(self):
+        """(text, conf) agreed so far; ("", 0) before any usable read."""
+        if not self._lengths:
+            return "", 0
+        length = max(self._lengths, key=self._lengths.get)
+        votes = [defaultdict(float) for _ in range(length)]
+        for text, conf in self.reads:
+            if len(text) != length:
+                continue
+            for i, ch in enumerate(text):
+                votes[i][ch] += conf / 100.0
+
+        # Reads of another length count against every position.
+        all_weight = sum(self._lengths.values())
+        chars, worst = [], 1.0
+        for pos in votes:
+            ch = max(pos, key=pos.get)
+            chars.append(ch)
+            worst = min(worst, pos[ch] / (all_weight + self.prior))
+        return "".join(chars), round(worst * 100, 1)
+
+    @property
+    def done(self):
+        """True once no more OCR calls are useful for this plate."""
+        if len(self.reads) >= self.max_reads:
+            return True
+        if len(self.reads) < self.min_reads:
+            return False
+        return self.consensus()[1] >= self.threshold
+
+
+def main():
+    paths = sys.argv[1:]
+    if not paths:
+        print("Usage: python plate_voting.py shot1.jpg shot2.jpg [...]")
+        sys.exit(1)
+
+    import numpy as np
+    from PIL import Image
+    from marearts_anpr import ma_anpr_detector_v16, ma_anpr_ocr_v16
+    from batch_inference import box_conf, box_ltrb, crop_plate
+    from video_stream import PlateTracker
+
+    user_name, serial_key, signature = load_credentials()
+    if not all([user_name, serial_key, signature]):
+        print("No credentials. Run: ma-anpr config")
+        sys.exit(1)
+
+    print("Loading models...")
+    detector = ma_anpr_detector_v16(
+        "640p_fp32", user_name, serial_key, signature, backend="auto",
+    )
+    ocr = ma_anpr_ocr_v16(
+        "fp32", "univ", user_name, serial_key, signature, backend="auto",
+    )
+
+    tracker = PlateTracker(iou_thres=0.2, max_missed=len(paths))
+    ocr_calls = 0
+    for i, path in enumerate(paths):
+        frame = np.array(Image.open(path).convert("RGB"))[:, :, ::-1].copy()
+        boxes = detector.detector(frame)
+        matched, new = tracker.update([(box_ltrb(b), box_conf(b)) for b in boxes], i)
+        for track in new + matched:
+            if track.vote.done:
+                continue
+            crop = crop_plate(frame, [int(v) for v in track.ltrb])
+            if crop is not None:
+                text, conf = ocr.predict(crop)
+                track.vote.add(text, conf)
+                ocr_calls += 1
+                print(f"  {path}: track {track.track_id} read {text} ({conf}%)")
+
+    print(f"\n=== Final reads ({ocr_calls} OCR calls for {len(paths)} shots) ===")
+    for track in tracker.tracks.values():
+        text, conf = track.vote.consensus()
+        print(f"  track {track.track_id}: {text or '?'} ({conf}%) "
+              f"from {len(track.vote.reads)} read(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""MareArts ANPR — Process Pool with Shared-Memory Frames
+
+AnprProcessPool runs N worker processes, each with its own detector and
+OCR sessions pinned to its own set of CPU cores, so Python-side pre- and
+post-processing no longer contends on one GIL. The front end decodes each
+image and copies its pixels into a slot of a shared-memory ring buffer,
+swapping RGB to BGR on the way (PIL cannot decode into foreign memory,
+so the slot is filled by a copy, not by the decoder). Workers read the
+frame in place,
+with no pickling of pixels, and send back only the small result dict. A
+worker that dies fails the frame it was working on instead of leaving
+its future pending forever.
+
+    with AnprProcessPool(processes=4) as pool:
+        future = pool.submit("car.jpg")        # path, bytes, PIL or BGR array
+        print(future.result())                 # marearts_anpr_from_cv2 format + "worker"
+        for result in pool.map(paths):
+            ...
+"""
+import io
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from batch_inference import box_conf, box_ltrb, crop_plate, load_credentials
+
+
+def core_sets(processes):
+    """Split the CPUs this process may use into `processes` disjoint sets."""
+    if hasattr(os, "sched_getaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+    if len(cpus) < processes:
+        return [None] * processes
+    size = len(cpus) // processes
+    return [cpus[i * size:(i + 1) * size] for i in range(processes)]
+
+
+def _worker(index, cores, creds, models, shm_name, slot_bytes, tasks, results, free, current):
+    if cores:
+        os.environ["OMP_NUM_THREADS"] = str(len(cores))
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cores)
+    try:
+        from marearts_anpr import ma_anpr_detector_v16, ma_anpr_ocr_v16
+
+        detector_model, ocr_model, region, backend = models
+        detector = ma_anpr_detector_v16(detector_model, *creds, backend=backend)
+        ocr = ma_anpr_ocr_v16(ocr_model, region, *creds, backend=backend)
+        shm = shared_memory.SharedMemory(name=shm_name)
+    except Exception as e:
+        results.put((None, False, f"worker {index}: {e!r}"))
+        return
+    results.put((None, True, index))
+
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            job_id, slot, shape = task
+            current[index] = job_id
+            frame = None
+            try:
+                frame = np.ndarray(shape, np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+                t0 = time.perf_counter()
+                boxes = detector.detector(frame)
+                det_sec = time.perf_counter() - t0
+
+                t0 = time.perf_counter()
+                plates = []
+                for box in boxes:
+                    ltrb = box_ltrb(box)
+                    crop = crop_plate(frame, ltrb)
+                    text, conf = ocr.predict(crop) if crop is not None else ("", 0)
+                    plates.append({"ocr": text, "ocr_conf": conf,
+                                   "ltrb": ltrb, "ltrb_conf": box_conf(box)})
+                results.put((job_id, True, {
+                    "results": plates,
+                    "ltrb_proc_sec": round(det_sec, 4),
+                    "ocr_proc_sec": round(time.perf_counter() - t0, 4),
+                    "worker": index,
+                }))
+            except Exception as e:
+                results.put((job_id, False, repr(e)))
+            finally:
+                del frame
+                current[index] = -1
+                free.put(slot)
+    finally:
+        del detector, ocr
+        shm.close()
+
+
+class AnprProcessPool:
+    """Detection + OCR in `processes` worker processes fed through shared memory.
+
+    The ring has `slots` frame slots of `slot_mb` MB each (default: two per
+    worker, enough for a 12 MP BGR frame); submit() blocks while every
+    slot is in use. With `pin_cores` each worker gets a disjoint share of
+    the CPUs. Workers that have not loaded their models within
+    `startup_timeout` seconds, or that exit while loading, fail the
+    constructor.
+    """
+
+    def __init__(self, processes=2, detector_model="640p_fp32", ocr_model="fp32",
+                 region="univ", backend="cpu", slots=None, slot_mb=36, pin_cores=True,
+                 credentials=None, startup_timeout=600):
+        creds = credentials or load_credentials()
+        if not all(creds):
+            raise ValueError("No credentials. Run: ma-anpr config")
+
+        ctx = mp.get_context("spawn")
+        self.processes = processes
+        self.slot_bytes = int(slot_mb * 1024 * 1024)
+        slots = slots or processes * 2
+        self._shm = shared_memory.SharedMemory(create=True, size=slots * self.slot_bytes)
+        self._free = ctx.Queue()
+        for i in range(slots):
+            self._free.put(i)
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self._futures = {}  # job id -> (future, slot)
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._dead = set()
+        self._broken = None
+        self._current = ctx.Array("q", [-1] * processes, lock=False)  # job id per worker
+
+        cores = core_sets(processes) if pin_cores else [None] * processes
+        models = (detector_model, ocr_model, region, backend)
+        self._procs = [
+            ctx.Process(target=_worker, name=f"anpr-worker-{i}", daemon=True,
+                        args=(i, cores[i], creds, models, self._shm.name,
+                              self.slot_bytes, self._tasks, self._results, self._free,
+                              self._current))
+            for i in range(processes)
+        ]
+        for p in self._procs:
+            p.start()
+
+        errors = []
+        reported = 0
+        deadline = time.monotonic() + startup_timeout
+        while reported < processes:
+            try:
+                _, ok, info = self._results.get(timeout=1.0)
+            except queue.Empty:
+                crashed = [p for p in self._procs if p.exitcode is not None]
+                if len(crashed) > len(errors):
+                    # Died without reporting (a segfault or kill while loading models).
+                    errors += [f"{p.name} exited with code {p.exitcode} during startup"
+                               for p in crashed]
+                    break
+                if time.monotonic() > deadline:
+                    errors.append(f"workers not ready after {startup_timeout}s")
+                    break
+                continue
+            reported += 1
+            if not ok:
+                errors.append(info)
+        if errors:
+            self.close()
+            raise RuntimeError("; ".join(errors))
+
+        self._collector = threading.Thread(target=self._collect, name="anpr-collect", daemon=True)
+        self._collector.start()
+
+    def _collect(self):
+        next_check = time.monotonic() + 1.0
+        while True:
+            try:
+                message = self._results.get(timeout=1.0)
+            except queue.Empty:
+                message = None
+            if message is not None and not self._deliver(*message):
+                return
+            if time.monotonic() >= next_check:
+                if not self._check_workers():
+                    return
+                next_check = time.monotonic() + 1.0
+
+    def _deliver(self, job_id, ok, payload):
+        """Resolve the future of one result message; False for the stop message."""
+        if job_id is None:
+            return payload != "stop"
+        with self._lock:
+            future, _ = self._futures.pop(job_id, (None, None))
+        if future is not None:
+            if ok:
+                future.set_result(payload)
+            else:
+                future.set_exception(RuntimeError(payload))
+        return True
+
+    def _check_workers(self):
+        """Fail the frames of workers that died; fail everything once none is left.
+
+        Results already queued are delivered first, so a frame that finished
+        before its worker died still gets its result. False if the stop
+        message turned up while draining.
+        """
+        if self._closed:
+            return True
+        with self._lock:
+            died = [(i, p) for i, p in enumerate(self._procs)
+                    if i not in self._dead and not p.is_alive()]
+        if not died:
+            return True
+        while True:
+            try:
+                message = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if not self._deliver(*message):
+                return False
+        failed = []
+        with self._lock:
+            for i, p in died:
+                self._dead.add(i)
+                job_id = self._current[i]
+                if job_id >= 0 and job_id in self._futures:
+                    future, slot = self._futures.pop(job_id)
+                    self._free.put(slot)
+                    failed.append((future, f"worker {i} died (exit code {p.exitcode}) "
+                                           "while processing this frame"))
+            if len(self._dead) == len(self._procs):
+                self._broken = "all worker processes died"
+                failed += [(future, self._broken) for future, _ in self._futures.values()]
+                self._futures.clear()
+        for future, message in failed:
+            future.set_exception(RuntimeError(message))
+        return True
+
+    def submit(self, image):
+        """Decode `image`, copy it into a free slot and queue it; returns a Future."""
+        if self._closed:
+            raise RuntimeError("pool is closed")
+        if self._broken:
+            raise RuntimeError(self._broken)
+        bgr = None
+        if isinstance(image, np.ndarray):
+            bgr = image
+            shape = image.shape
+        else:
+            if isinstance(image, (str, Path)):
+                image = Image.open(image)
+            elif isinstance(image, (bytes, bytearray, memoryview)):
+                image = Image.open(io.BytesIO(image))
+            rgb = np.asarray(image.convert("RGB"))
+            shape = rgb.shape
+        if int(np.prod(shape)) > self.slot_bytes:
+            raise ValueError(f"frame {shape} does not fit a {self.slot_bytes} byte slot")
+
+        while True:
+            try:
+                slot = self._free.get(timeout=1.0)
+                break
+            except queue.Empty:
+                if self._broken:
+                    raise RuntimeError(self._broken) from None
+        view = np.ndarray(shape, np.uint8, buffer=self._shm.buf, offset=slot * self.slot_bytes)
+        if bgr is not None:
+            view[...] = bgr
+        else:
+            view[...] = rgb[:, :, ::-1]
+        del view
+
+        job_id = next(self._ids)
+        future = Future()
+        with self._lock:
+            self._futures[job_id] = (future, slot)
+        self._tasks.put((job_id, slot, shape))
+        return future
+
+    def map(self, images):
+        """Yield results for `images` in input order."""
+        pending = deque()
+        for image in images:
+            pending.append(self.submit(image))
+            while pending and pending[0].done():
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def close(self):
+        """Finish queued frames, stop the workers and free the shared memory."""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._procs:
+            self._tasks.put(None)
+        for p in self._procs:
+            p.join()
+        if getattr(self, "_collector", None) is not None:
+            self._results.put((None, True, "stop"))
+            self._collector.join()
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    SAMPLE = Path(__file__).resolve().parent.parent.parent / "sample_images"
+    paths = sorted(SAMPLE.glob("plate_*.jpg")) * 4
+
+    for processes in (1, 2, 4):
+        print(f"\n=== {processes} worker process(es), {len(paths)} images ===")
+        t0 = time.perf_counter()
+        with AnprProcessPool(processes=processes, detector_model="320p_fp32") as pool:
+            print(f"  workers ready in {time.perf_counter() - t0:.1f}s")
+            t0 = time.perf_counter()
+            workers = set()
+            for result in pool.map(paths):
+                workers.add(result["worker"])
+            elapsed = time.perf_counter() - t0
+        print(f"  {elapsed:.2f}s  ({len(paths) / elapsed:.1f} img/s), workers used: {sorted(workers)}")
+
+    print("\nDone.")
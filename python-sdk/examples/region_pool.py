@@ -0,0 +1,187 @@
+"""MareArts ANPR — Multi-Region OCR Pool
+
+OcrRegionPool keeps one warm ma_anpr_ocr_v16 per region instead of
+switching a single OCR object with ocr.set_region(). Requests for
+different regions run concurrently on their own sessions, and the least
+recently used region is evicted when `max_sessions` or
+`memory_budget_mb` is exceeded.
+
+    pool = OcrRegionPool("fp32", user_name, serial_key, signature, max_sessions=3)
+    text, conf = pool.predict("kr", plate_crop)
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from batch_inference import box_ltrb, crop_plate, load_credentials
+
+
+def _rss_mb():
+    """Resident memory of this process in MB (0 where unavailable)."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1e6
+    except ImportError:
+        pass
+    try:
+        import os
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, AttributeError):
+        return 0.0
+
+
+class _Entry:
+    __slots__ = ("ocr", "mb", "load_sec", "uses")
+
+    def __init__(self, ocr, mb, load_sec):
+        self.ocr = ocr
+        self.mb = mb
+        self.load_sec = load_sec
+        self.uses = 0
+
+
+class OcrRegionPool:
+    """LRU pool of per-region OCR sessions.
+
+    Region names are normalized with normalize_region_alias, so "korea" and
+    "kr" share a session. A region's memory cost is the RSS growth measured
+    while it loaded. The pool never calls set_region(), so a session handed
+    out by get() keeps its region even if it is evicted while in use.
+    """
+
+    def __init__(self, model_name, user_name, serial_key, signature, backend="auto",
+                 max_sessions=4, memory_budget_mb=None, preload=()):
+        self.model_name = model_name
+        self.backend = backend
+        self.max_sessions = max_sessions
+        self.memory_budget_mb = memory_budget_mb
+        self._creds = (user_name, serial_key, signature)
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+        for region in preload:
+            self.get(region)
+
+    @staticmethod
+    def normalize(region):
+        from marearts_anpr import normalize_region_alias
+        return normalize_region_alias(region) or region
+
+    def _load(self, region):
+        from marearts_anpr import ma_anpr_ocr_v16
+
+        before = _rss_mb()
+        t0 = time.perf_counter()
+        ocr = ma_anpr_ocr_v16(self.model_name, region, *self._creds, backend=self.backend)
+        return _Entry(ocr, max(_rss_mb() - before, 0.0), time.perf_counter() - t0)
+
+    def _evict(self):
+        """Drop least recently used regions until within limits (lock held)."""
+        def over():
+            if len(self._entries) > self.max_sessions:
+                return True
+            if self.memory_budget_mb is None:
+                return False
+            return sum(e.mb for e in self._entries.values()) > self.memory_budget_mb
+
+        while len(self._entries) > 1 and over():
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, region):
+        """Warm OCR session for `region`, loading it if needed."""
+        region = self.normalize(region)
+        while True:
+            with self._lock:
+                entry = self._entries.get(region)
+                if entry is not None:
+                    self._entries.move_to_end(region)
+                    entry.uses += 1
+                    self.hits += 1
+                    return entry.ocr
+                waiting = self._loading.get(region)
+                if waiting is None:
+                    done = self._loading[region] = threading.Event()
+                    self.misses += 1
+                    break
+            waiting.wait()  # another thread is loading this region
+
+        try:
+            entry = self._load(region)
+            entry.uses = 1
+            with self._lock:
+                self._entries[region] = entry
+                self._evict()
+            return entry.ocr
+        finally:
+            with self._lock:
+                del self._loading[region]
+            done.set()
+
+    def predict(self, region, crop):
+        """ocr.predict(crop) on the session for `region`."""
+        return self.get(region).predict(crop)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "regions": {r: {"mb": round(e.mb, 1), "load_sec": round(e.load_sec, 2),
+                                "uses": e.uses}
+                            for r, e in self._entries.items()},
+                "memory_mb": round(sum(e.mb for e in self._entries.values()), 1),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+if __name__ == "__main__":
+    import numpy as np
+    from PIL import Image
+    from marearts_anpr import ma_anpr_detector_v16
+
+    user_name, serial_key, signature = load_credentials()
+    if not all([user_name, serial_key, signature]):
+        print("No credentials. Run: ma-anpr config")
+        exit(1)
+
+    SAMPLE = Path(__file__).resolve().parent.parent.parent / "sample_images"
+    traffic = [("eup", SAMPLE / "eu-a.jpg"), ("kr", SAMPLE / "kr-a.jpg"),
+               ("eup", SAMPLE / "eu-b.jpg"), ("kr", SAMPLE / "kr-b.jpg"),
+               ("na", SAMPLE / "eu-a.jpg")] * 4
+
+    print("Loading models...")
+    detector = ma_anpr_detector_v16(
+        "640p_fp32", user_name, serial_key, signature, backend="auto",
+    )
+    pool = OcrRegionPool("fp32", user_name, serial_key, signature,
+                         max_sessions=3, preload=("eup", "kr", "na"))
+
+    def handle(job):
+        region, path = job
+        frame = np.array(Image.open(path).convert("RGB"))[:, :, ::-1].copy()
+        reads = []
+        for box in detector.detector(frame):
+            crop = crop_plate(frame, box_ltrb(box))
+            if crop is not None:
+                reads.append(pool.predict(region, crop))
+        return region, path.name, reads
+
+    print(f"\n=== Mixed eup / kr / na traffic ({len(traffic)} requests, 4 threads) ===")
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(4) as ex:
+        for region, name, reads in ex.map(handle, traffic):
+            print(f"  [{region:<4}] {name}: {reads or '(no plates)'}")
+    print(f"  {time.perf_counter() - t0:.2f}s")
+
+    print("\n=== Pool stats ===")
+    stats = pool.stats()
+    for region, e in stats["regions"].items():
+        print(f"  {region:<8} {e['mb']:7.1f} MB  loaded in {e['load_sec']:.2f}s  uses={e['uses']}")
+    print(f"  hits={stats['hits']} misses={stats['misses']} evictions={stats['evictions']}")
+
+    print("\nDone.")
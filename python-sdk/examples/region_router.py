@@ -0,0 +1,193 @@
+"""MareArts ANPR — Automatic Region Routing
+
+Instead of trying several regions per plate (multi_region.py), RegionRouter
+reads each detector crop once with a `univ` probe, checks the read for
+Hangul, kana, Chinese province prefixes, Cyrillic and per-region
+patterns, and reads the plate again with the winning warm regional
+session from an OcrRegionPool. The classifier is fully offline. The
+crop's aspect ratio only breaks ties (`layout_weight`): on its own it
+cannot tell the regions apart, since EU and Korean long plates are both
+520x110 mm and 2:1 plates fit North America, Japan and Korean short
+plates. If no region reaches `min_score`, the best two are within
+`margin` of each other, or the winner is the probe region itself, the
+probe read is returned as-is.
+
+Routing costs two OCR calls per routed plate. `probe_region=None` turns
+routing off: every plate is read once with `fallback_region` (`univ`),
+which is what a single-call reader can honestly do without a label.
+
+The result carries the `region` that did the read, its `region_score`
+(None when nothing was routed) and the number of OCR calls spent
+(`ocr_calls`).
+
+    router = RegionRouter(pool, candidates=("eup", "kr", "na"))
+    read = router.read(plate_crop)   # {"ocr", "ocr_conf", "region", "region_score", ...}
+"""
+import re
+import time
+from pathlib import Path
+
+from batch_inference import box_ltrb, crop_plate, load_credentials
+from region_pool import OcrRegionPool
+
+# Typical width / height of a plate crop, (centre, tolerance) per region.
+# Shapes overlap between regions (eup / kr long plates are identical), so
+# they only weigh in next to a probe read.
+LAYOUTS = {
+    "eup": [(4.7, 1.2)],
+    "kr": [(4.7, 1.2), (2.0, 0.6)],
+    "na": [(2.0, 0.6)],
+    "jp": [(1.9, 0.5)],
+    "cn": [(3.1, 0.8)],
+}
+
+_HANGUL = re.compile(r"[가-힣]")
+_KANA = re.compile(r"[぀-ヿ]")
+_HAN = re.compile(r"[一-鿿]")
+_CYRILLIC = re.compile(r"[Ѐ-ӿ]")
+
+FORMATS = {
+    "kr": re.compile(r"^\d{2,3}[가-힣]\d{4}$"),
+    "cn": re.compile(r"^[一-鿿][A-Z][A-Z0-9]{5,6}$"),
+    "eup": re.compile(r"^(?=.*[A-ZЀ-ӿ])(?=.*\d)[A-ZЀ-ӿ0-9]{5,9}$"),
+    "na": re.compile(r"^(?=.*\d)[A-Z0-9]{5,8}$"),
+}
+
+
+def layout_scores(width, height, candidates):
+    """0..1 per region from the crop's aspect ratio."""
+    ratio = width / float(max(height, 1))
+    scores = {}
+    for region in candidates:
+        best = 0.0
+        for centre, tol in LAYOUTS.get(region, []):
+            best = max(best, 1.0 - min(abs(ratio - centre) / (2 * tol), 1.0))
+        scores[region] = best
+    return scores
+
+
+def format_scores(text, candidates):
+    """0..1 per region from the characters and pattern of a probe read."""
+    text = re.sub(r"[\s\-·.]", "", text or "").upper()
+    scores = {r: 0.0 for r in candidates}
+    if not text:
+        return scores
+    script = None
+    if _HANGUL.search(text):
+        script = "kr"
+    elif _KANA.search(text):
+        script = "jp"
+    elif _HAN.search(text):
+        script = "jp" if "jp" in candidates and "cn" not in candidates else "cn"
+    elif _CYRILLIC.search(text):
+        script = "eup"
+    for region in candidates:
+        fmt = FORMATS.get(region)
+        if script is not None:
+            scores[region] = 1.0 if region == script else 0.0
+            if region == script and fmt is not None and not fmt.match(text):
+                scores[region] = 0.8
+        elif fmt is not None and fmt.match(text):
+            scores[region] = 0.6
+    return scores
+
+
+class RegionRouter:
+    """Route each plate crop to the best regional OCR session of `pool`.
+
+    A plate is read up to twice (probe, then routed region), and
+    `layout_weight` balances aspect-ratio evidence against the probe
+    read. With `probe_region=None` nothing is routed and every plate is
+    read once with `fallback_region`.
+    """
+
+    def __init__(self, pool, candidates=("eup", "kr", "na", "cn", "jp"),
+                 probe_region="univ", min_score=0.5, layout_weight=0.4,
+                 fallback_region="univ", margin=0.1):
+        self.pool = pool
+        self.candidates = tuple(candidates)
+        self.probe_region = probe_region
+        self.min_score = min_score
+        self.layout_weight = layout_weight
+        self.fallback_region = fallback_region
+        self.margin = margin
+
+    def classify(self, crop, probe_text):
+        """{region: score} for `crop` and its probe read, best first."""
+        layout = layout_scores(crop.width, crop.height, self.candidates)
+        fmt = format_scores(probe_text, self.candidates)
+        w = self.layout_weight
+        scores = {r: w * layout[r] + (1 - w) * fmt[r] for r in self.candidates}
+        return dict(sorted(scores.items(), key=lambda kv: kv[1], reverse=True))
+
+    def read(self, crop):
+        """OCR `crop` with the routed region; returns a read dict."""
+        if self.probe_region is None:
+            text, conf = self.pool.predict(self.fallback_region, crop)
+            return {"ocr": text, "ocr_conf": conf, "region": self.fallback_region,
+                    "region_score": None, "probe_ocr": "", "ocr_calls": 1}
+
+        probe_text, probe_conf = self.pool.predict(self.probe_region, crop)
+        scores = list(self.classify(crop, probe_text).items())
+        region, score = scores[0]
+        runner_up = scores[1][1] if len(scores) > 1 else 0.0
+        if region == self.probe_region:
+            return {"ocr": probe_text, "ocr_conf": probe_conf,
+                    "region": region, "region_score": round(score, 3),
+                    "probe_ocr": probe_text, "ocr_calls": 1}
+        if score < self.min_score or score - runner_up < self.margin:
+            return {"ocr": probe_text, "ocr_conf": probe_conf,
+                    "region": self.probe_region, "region_score": None,
+                    "probe_ocr": probe_text, "ocr_calls": 1}
+
+        text, conf = self.pool.predict(region, crop)
+        return {"ocr": text, "ocr_conf": conf,
+                "region": region, "region_score": round(score, 3),
+                "probe_ocr": probe_text, "ocr_calls": 2}
+
+
+if __name__ == "__main__":
+    import numpy as np
+    from PIL import Image
+    from marearts_anpr import ma_anpr_detector_v16
+
+    user_name, serial_key, signature = load_credentials()
+    if not all([user_name, serial_key, signature]):
+        print("No credentials. Run: ma-anpr config")
+        exit(1)
+
+    SAMPLE = Path(__file__).resolve().parent.parent.parent / "sample_images"
+    images = [SAMPLE / "eu-a.jpg", SAMPLE / "eu-b.jpg", SAMPLE / "kr-a.jpg", SAMPLE / "kr-b.jpg"]
+
+    print("Loading models...")
+    detector = ma_anpr_detector_v16(
+        "640p_fp32", user_name, serial_key, signature, backend="auto",
+    )
+    pool = OcrRegionPool("fp32", user_name, serial_key, signature,
+                         preload=("univ", "eup", "kr", "na"))
+    routers = {
+        "univ only (1 OCR call)": RegionRouter(pool, candidates=("eup", "kr", "na"),
+                                               probe_region=None),
+        "univ probe (2 OCR calls)": RegionRouter(pool, candidates=("eup", "kr", "na")),
+    }
+    crops = []
+    for path in images:
+        frame = np.array(Image.open(path).convert("RGB"))[:, :, ::-1].copy()
+        for box in detector.detector(frame):
+            crop = crop_plate(frame, box_ltrb(box))
+            if crop is not None:
+                crops.append((path, crop))
+
+    for name, router in routers.items():
+        print(f"\n=== {name} ===")
+        print(f"  {'Image':<10} {'Probe':<14} {'Region':<7} {'Score':>5}  {'Plate':<14} {'Conf':>6}")
+        print(f"  {'-'*10} {'-'*14} {'-'*7} {'-'*5}  {'-'*14} {'-'*6}")
+        for path, crop in crops:
+            t0 = time.perf_counter()
+            r = router.read(crop)
+            score = "-" if r["region_score"] is None else f"{r['region_score']:.2f}"
+            print(f"  {path.name:<10} {r['probe_ocr']:<14} {r['region']:<7} "
+                  f"{score:>5}  {r['ocr']:<14} {r['ocr_conf']:>5}%"
+                  f"  ({r['ocr_calls']} call(s), {time.perf_counter() - t0:.3f}s)")
+
+    print("\nDone.")
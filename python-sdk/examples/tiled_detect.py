@@ -0,0 +1,182 @@
+"""MareArts ANPR — Tiled Detection for High-Resolution Frames
+
+The 640p / 320p detectors letterbox the whole frame into their input, so on
+a wide-angle 4K camera a distant plate shrinks to a few pixels before the
+model sees it. TiledDetector splits the frame into overlapping tiles, runs
+the detector on each tile (one call per tile, spread over a thread pool),
+shifts the boxes back to frame coordinates and merges duplicates from
+overlapping tiles with NMS at the detector's `iou_thres`. A plate cut by
+a tile edge leaves a partial box inside the full box that the
+neighbouring tile (or the full frame) finds, so overlap is measured
+against the smaller box, and boxes touching an interior tile edge lose
+to boxes that do not. Optionally the full frame is detected as well, so
+plates larger than a tile are still found.
+
+    tiled = TiledDetector(detector, tile_size=1280, overlap=0.2)
+    boxes = tiled.detector(frame_bgr)            # same format as detector.detector
+    result = anpr_batch(tiled, ocr, [frame_bgr])[0]
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from batch_inference import DEFAULT_WORKERS, load_credentials
+
+
+def tile_grid(width, height, tile_size=1280, overlap=0.2):
+    """[(l, t, r, b), ...] covering the frame with tiles overlapping by `overlap`."""
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        step = max(int(tile_size * (1.0 - overlap)), 1)
+        n = int(np.ceil((length - tile_size) / float(step))) + 1
+        # Spread the tiles evenly so the last one ends exactly at the edge.
+        return [int(round(i * (length - tile_size) / float(n - 1))) for i in range(n)]
+
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+            for y in starts(height) for x in starts(width)]
+
+
+def nms(boxes, iou_thres, priority=None):
+    """Greedy non-maximum suppression over detector box dicts, best score first.
+
+    Overlap is intersection over the smaller box, so a partial box lying
+    inside a larger one is suppressed. Boxes with a higher `priority`
+    (one value per box) are kept before any box with a lower one.
+    """
+    if len(boxes) <= 1:
+        return list(boxes)
+    ltrb = np.array([b["bbox"][:4] for b in boxes], dtype=np.float32)
+    scores = np.array([b.get("score", 0.0) for b in boxes], dtype=np.float32)
+    areas = (ltrb[:, 2] - ltrb[:, 0]) * (ltrb[:, 3] - ltrb[:, 1])
+    if priority is None:
+        order = scores.argsort()[::-1]
+    else:
+        order = np.lexsort((scores, np.asarray(priority)))[::-1]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.clip(np.minimum(ltrb[i, 2], ltrb[rest, 2]) - np.maximum(ltrb[i, 0], ltrb[rest, 0]), 0, None)
+        h = np.clip(np.minimum(ltrb[i, 3], ltrb[rest, 3]) - np.maximum(ltrb[i, 1], ltrb[rest, 1]), 0, None)
+        inter = w * h
+        overlap = inter / np.maximum(np.minimum(areas[i], areas[rest]), 1e-9)
+        order = rest[overlap < iou_thres]
+    return [boxes[i] for i in keep]
+
+
+class TiledDetector:
+    """`detector` run over overlapping tiles; other attributes pass through.
+
+    `tile_size` is in frame pixels; frames no larger than one tile are
+    detected directly. With `include_full` the whole frame is detected as
+    one more tile. `iou_thres` defaults to the wrapped detector's.
+    `edge_margin` is how close (in pixels) a box may come to an interior
+    tile edge before it counts as cut.
+
+    Tiles run on a pool owned by this detector, not the shared
+    batch_inference pool: anpr_batch() calls `detector` from that pool, and
+    tile tasks queued behind the frames waiting for them would never run.
+    `workers=1` detects the tiles in the calling thread.
+    """
+
+    def __init__(self, detector, tile_size=1280, overlap=0.2, include_full=True,
+                 iou_thres=None, workers=DEFAULT_WORKERS, edge_margin=2):
+        self._detector = detector
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.include_full = include_full
+        self.iou_thres = iou_thres if iou_thres is not None else getattr(detector, "iou_thres", 0.5)
+        self.workers = workers
+        self.edge_margin = edge_margin
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self._detector, name)
+
+    def detector(self, frame_bgr):
+        h, w = frame_bgr.shape[:2]
+        if max(h, w) <= self.tile_size:
+            return self._detector.detector(frame_bgr)
+
+        tiles = tile_grid(w, h, self.tile_size, self.overlap)
+        inputs = [np.ascontiguousarray(frame_bgr[t:b, l:r]) for l, t, r, b in tiles]
+        if self.include_full:
+            inputs.append(frame_bgr)
+            tiles.append((0, 0, w, h))
+
+        merged, whole = [], []
+        m = self.edge_margin
+        for (x0, y0, x1, y1), boxes in zip(tiles, self._detect_tiles(inputs)):
+            for box in boxes:
+                box = dict(box)
+                l, t, r, b = box.get("bbox", box.get("box"))[:4]
+                box.pop("box", None)
+                box["bbox"] = [l + x0, t + y0, r + x0, b + y0]
+                merged.append(box)
+                # Touching a tile edge that is not a frame edge: likely a cut plate.
+                cut = ((x0 > 0 and l <= m) or (y0 > 0 and t <= m)
+                       or (x1 < w and r >= x1 - x0 - m) or (y1 < h and b >= y1 - y0 - m))
+                whole.append(not cut)
+        return nms(merged, self.iou_thres, whole)
+
+    def _detect_tiles(self, inputs):
+        if self.workers <= 1:
+            return [self._detector.detector(tile) for tile in inputs]
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers,
+                                                thread_name_prefix="anpr-tiles")
+        return list(self._pool.map(self._detector.detector, inputs))
+
+    def close(self):
+        """Shut down the tile pool (it is recreated on the next call)."""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from pathlib import Path
+    from PIL import Image
+    from marearts_anpr import ma_anpr_detector_v16
+
+    user_name, serial_key, signature = load_credentials()
+    if not all([user_name, serial_key, signature]):
+        print("No credentials. Run: ma-anpr config")
+        exit(1)
+
+    SAMPLE = Path(__file__).resolve().parent.parent.parent / "sample_images"
+    paths = [Path(p) for p in sys.argv[1:]] or sorted(SAMPLE.glob("*.jpg"))
+
+    print("Loading models...")
+    detector = ma_anpr_detector_v16(
+        "640p_fp32", user_name, serial_key, signature, backend="cpu",
+    )
+
+    for path in paths:
+        frame = np.array(Image.open(path).convert("RGB"))[:, :, ::-1].copy()
+        h, w = frame.shape[:2]
+        # Place small samples in a corner of a 4K canvas, like a distant car.
+        if max(h, w) < 2000:
+            canvas = np.full((2160, 3840, 3), 96, dtype=np.uint8)
+            canvas[2160 - min(h, 2160):, :min(w, 3840)] = frame[:2160, :3840]
+            frame = canvas
+        tiled = TiledDetector(detector, tile_size=1280, overlap=0.2)
+
+        print(f"\n=== {path.name} ({frame.shape[1]}x{frame.shape[0]}, "
+              f"{len(tile_grid(frame.shape[1], frame.shape[0]))} tiles) ===")
+        for name, det in (("whole frame", detector), ("tiled", tiled)):
+            t0 = time.perf_counter()
+            boxes = det.detector(frame)
+            elapsed = time.perf_counter() - t0
+            scores = [round(b.get("score", 0.0), 2) for b in boxes]
+            print(f"  {name:<12} {len(boxes)} plate(s) {scores}  {elapsed:.3f}s")
+
+    print("\nDone.")
@@ -0,0 +1,311 @@
+"""MareArts ANPR — Video / Stream Source
+
+marearts_anpr_from_video() reads frames from a video file, webcam index
+or any URL cv2.VideoCapture can open (RTSP, HTTP). It runs the detector
+every `detect_every` frames, tracks plate boxes in between with IoU
+matching plus a constant-velocity prediction, and only calls OCR when a
+track is new or its plate vote (plate_voting.py) has not yet reached
+`min_ocr_conf`. Each vehicle is reported once through `on_final` when its
+track ends. With a RoiMotionGate (motion_gate.py) the detector only runs
+inside the ROIs and only when something there moved.
+
+Prerequisites:
+    pip install opencv-python
+
+Usage:
+    python video_stream.py traffic.mp4
+    python video_stream.py rtsp://camera/stream --detect-every 3
+    python video_stream.py rtsp://gate/stream --motion --roi "100,400;1800,400;1900,1080;0,1080"
+"""
+import sys
+import time
+
+try:
+    import cv2
+except ImportError:
+    print("pip install opencv-python")
+    sys.exit(1)
+
+from batch_inference import box_conf, box_ltrb, crop_plate, load_credentials
+from motion_gate import GatedDetector, RoiMotionGate, parse_roi
+from plate_voting import PlateVote
+
+
+def iou(a, b):
+    l, t = max(a[0], b[0]), max(a[1], b[1])
+    r, btm = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, r - l) * max(0, btm - t)
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / float(area_a + area_b - inter)
+
+
+class Track:
+    """One plate followed across frames."""
+
+    def __init__(self, track_id, ltrb, conf, frame_index, vote):
+        self.track_id = track_id
+        self.ltrb = [float(v) for v in ltrb]
+        self.ltrb_conf = conf
+        self.velocity = [0.0, 0.0, 0.0, 0.0]
+        self.first_seen = frame_index
+        self.last_seen = frame_index
+        self.hits = 1
+        self.vote = vote
+
+    def predict(self, frames=1):
+        """Box expected `frames` frames after the last update."""
+        return [p + v * frames for p, v in zip(self.ltrb, self.velocity)]
+
+    def update(self, ltrb, conf, frame_index):
+        gap = max(frame_index - self.last_seen, 1)
+        self.velocity = [(n - o) / gap for n, o in zip(ltrb, self.ltrb)]
+        self.ltrb = [float(v) for v in ltrb]
+        self.ltrb_conf = conf
+        self.last_seen = frame_index
+        self.hits += 1
+
+    def final(self):
+        """One read for the whole track, as passed to `on_final`."""
+        text, conf = self.vote.consensus()
+        return {
+            "track_id": self.track_id,
+            "ocr": text,
+            "ocr_conf": conf,
+            "reads": len(self.vote.reads),
+            "first_frame": self.first_seen,
+            "last_frame": self.last_seen,
+            "ltrb": [int(v) for v in self.ltrb],
+            "ltrb_conf": self.ltrb_conf,
+        }
+
+
+class PlateTracker:
+    """Greedy IoU tracker; a track is dropped after `max_missed` frames unseen.
+
+    Every new track gets a PlateVote that is done at `min_ocr_conf`.
+    """
+
+    def __init__(self, iou_thres=0.3, max_missed=30, min_ocr_conf=90):
+        self.iou_thres = iou_thres
+        self.max_missed = max_missed
+        self.min_ocr_conf = min_ocr_conf
+        self.tracks = {}
+        self._next_id = 1
+
+    def update(self, detections, frame_index):
+        """Match [(ltrb, conf), ...] to tracks; returns (matched, new) tracks."""
+        pairs = []
+        for tid, track in self.tracks.items():
+            guess = track.predict(frame_index - track.last_seen)
+            for j, (ltrb, _) in enumerate(detections):
+                score = iou(guess, ltrb)
+                if score >= self.iou_thres:
+                    pairs.append((score, tid, j))
+        pairs.sort(reverse=True)
+
+        used_tracks, used_dets, matched = set(), set(), []
+        for _, tid, j in pairs:
+            if tid in used_tracks or j in used_dets:
+                continue
+            used_tracks.add(tid)
+            used_dets.add(j)
+            ltrb, conf = detections[j]
+            self.tracks[tid].update(ltrb, conf, frame_index)
+            matched.append(self.tracks[tid])
+
+        new = []
+        for j, (ltrb, conf) in enumerate(detections):
+            if j in used_dets:
+                continue
+            track = Track(self._next_id, ltrb, conf, frame_index,
+                          PlateVote(threshold=self.min_ocr_conf))
+            self.tracks[track.track_id] = track
+            self._next_id += 1
+            new.append(track)
+        return matched, new
+
+    def expire(self, frame_index):
+        """Remove and return tracks not seen for more than `max_missed` frames."""
+        gone = [t for t in self.tracks.values()
+                if frame_index - t.last_seen > self.max_missed]
+        for t in gone:
+            del self.tracks[t.track_id]
+        return gone
+
+
+def open_source(source):
+    """cv2.VideoCapture for a file path, URL or camera index ("0")."""
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    cap = cv2.VideoCapture(source if isinstance(source, int) else str(source))
+    if not cap.isOpened():
+        raise IOError(f"cannot open video source: {source}")
+    return cap
+
+
+def marearts_anpr_from_video(detector, ocr, source, detect_every=5, min_ocr_conf=90,
+                             iou_thres=0.3, max_missed=None, max_frames=None,
+                             on_final=None, gate=None):
+    """Yield one result dict per frame of `source`.
+
+    Each plate in `results` carries a `track_id` and the track's consensus
+    read; `ocr_fresh` is True on the frames where OCR actually ran for that
+    track. On frames between detector runs the boxes are the tracker's
+    predictions and `detected` is False. `on_final(read)` is called once per
+    track with a non-empty plate, when the track expires or the stream ends.
+
+    With a RoiMotionGate as `gate`, a detection frame with no motion in the
+    ROIs skips the detector (`detected` is False) and the tracks found by
+    the last detector run are held in place.
+    """
+    cap = open_source(source)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    if max_missed is None:
+        max_missed = detect_every * 3
+    tracker = PlateTracker(iou_thres=iou_thres, max_missed=max_missed,
+                           min_ocr_conf=min_ocr_conf)
+    gated = GatedDetector(detector, gate) if gate is not None else None
+    last_detect = None
+
+    def _emit(tracks):
+        if on_final is None:
+            return
+        for track in tracks:
+            read = track.final()
+            if read["ocr"]:
+                on_final(read)
+
+    frame_index = 0
+    try:
+        while max_frames is None or frame_index < max_frames:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            detected = frame_index % detect_every == 0
+            det_sec = ocr_sec = 0.0
+            fresh = set()
+
+            if detected and gated is not None and not gate.motion(frame):
+                # Nothing moved: whatever the last detector run saw is still there.
+                detected = False
+                for track in tracker.tracks.values():
+                    if track.last_seen == last_detect:
+                        track.velocity = [0.0, 0.0, 0.0, 0.0]
+                        track.last_seen = frame_index
+                last_detect = frame_index
+
+            if detected:
+                t0 = time.perf_counter()
+                boxes = gated.detect_roi(frame) if gated is not None else detector.detector(frame)
+                det_sec = time.perf_counter() - t0
+                last_detect = frame_index
+                matched, new = tracker.update(
+                    [(box_ltrb(b), box_conf(b)) for b in boxes], frame_index)
+                _emit(tracker.expire(frame_index))
+
+                t0 = time.perf_counter()
+                if ocr is not None:
+                    for track in new + matched:
+                        if track.vote.done:
+                            continue
+                        crop = crop_plate(frame, [int(v) for v in track.ltrb])
+                        if crop is None:
+                            continue
+                        track.vote.add(*ocr.predict(crop))
+                        fresh.add(track.track_id)
+                ocr_sec = time.perf_counter() - t0
+                visible = [t for t in tracker.tracks.values() if t.last_seen == frame_index]
+            else:
+                visible = [t for t in tracker.tracks.values()
+                           if frame_index - t.last_seen <= detect_every]
+
+            results = []
+            for track in visible:
+                ltrb = track.ltrb if detected else track.predict(frame_index - track.last_seen)
+                text, conf = track.vote.consensus()
+                results.append({
+                    "track_id": track.track_id,
+                    "ocr": text,
+                    "ocr_conf": conf,
+                    "ocr_fresh": track.track_id in fresh,
+                    "ltrb": [int(v) for v in ltrb],
+                    "ltrb_conf": track.ltrb_conf,
+                })
+            yield {
+                "frame_index": frame_index,
+                "timestamp_sec": round(frame_index / fps, 3),
+                "detected": detected,
+                "results": results,
+                "ltrb_proc_sec": round(det_sec, 4),
+                "ocr_proc_sec": round(ocr_sec, 4),
+            }
+            frame_index += 1
+        _emit(list(tracker.tracks.values()))
+    finally:
+        cap.release()
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="ANPR on a video file or stream")
+    parser.add_argument("source", help="Video file, stream URL or camera index")
+    parser.add_argument("--region", default="univ", help="OCR region (default: univ)")
+    parser.add_argument("--detect-every", type=int, default=5,
+                        help="Run the detector every N frames (default: 5)")
+    parser.add_argument("--min-ocr-conf", type=float, default=90,
+                        help="Re-read a track until its vote confidence reaches this")
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--motion", action="store_true",
+                        help="Skip detection on frames with no motion in the ROIs")
+    parser.add_argument("--roi", action="append", default=[], metavar="X,Y;X,Y;...",
+                        help="ROI polygon in frame pixels (repeatable; implies --motion)")
+    args = parser.parse_args()
+
+    from marearts_anpr import ma_anpr_detector_v16, ma_anpr_ocr_v16
+
+    user_name, serial_key, signature = load_credentials()
+    if not all([user_name, serial_key, signature]):
+        print("No credentials. Run: ma-anpr config")
+        sys.exit(1)
+
+    print("Loading models...")
+    detector = ma_anpr_detector_v16(
+        "640p_fp32", user_name, serial_key, signature, backend="auto",
+    )
+    ocr = ma_anpr_ocr_v16(
+        "fp32", args.region, user_name, serial_key, signature, backend="auto",
+    )
+
+    finals = []
+
+    def on_final(read):
+        finals.append(read)
+        print(f"  vehicle (track {read['track_id']}): {read['ocr']} ({read['ocr_conf']}%) "
+              f"frames {read['first_frame']}-{read['last_frame']}, {read['reads']} read(s)")
+
+    gate = None
+    if args.motion or args.roi:
+        gate = RoiMotionGate(rois=[parse_roi(r) for r in args.roi])
+
+    frames = ocr_calls = 0
+    t_start = time.time()
+    for out in marearts_anpr_from_video(detector, ocr, args.source,
+                                        detect_every=args.detect_every,
+                                        min_ocr_conf=args.min_ocr_conf,
+                                        max_frames=args.max_frames,
+                                        on_final=on_final, gate=gate):
+        frames += 1
+        ocr_calls += sum(1 for r in out["results"] if r["ocr_fresh"])
+
+    total = time.time() - t_start
+    print(f"\nDone: {frames} frames in {total:.1f}s ({frames / max(total, 1e-9):.1f} fps), "
+          f"{len(finals)} vehicles, {ocr_calls} OCR calls")
+    if gate is not None:
+        print(f"Motion gate: {gate.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""MareArts ANPR — Compiled Watchlist Matcher
+
+Checking every detected plate against every watchlist entry costs
+O(entries) per plate. That is too slow once a watchlist holds hundreds
+of thousands of plates. Watchlist compiles the entries into indexes, so
+a lookup costs roughly the length of the plate, not the size of the
+list:
+
+- exact entries: a hash of the normalized plate (upper case, no spaces
+  or hyphens)
+- wildcard entries (`BG24*`, `?B12*CD`): a trie walked as an NFA, where
+  `*` is any run of characters and `?` is one character
+- fuzzy matches: with `max_distance` > 0, each entry is also indexed by
+  its OCR-confusion-folded form (0/O/Q/D, 1/I/L, 8/B, 5/S, 2/Z, 6/G, see
+  history_search.py) and every variant with up to int(max_distance)
+  characters deleted (a SymSpell-style deletion index). A plate
+  generates the same variants of itself. Shared variants give
+  candidates, which are checked with the confusion-aware edit distance:
+  a confusable swap costs 0.25 and any other edit costs 1
+
+Watchlist.match() returns (entry, label, distance) tuples, so a
+Watchlist can be passed directly as HistoryWriter(match=...). backfill()
+applies a new entry to the history already recorded. It uses the
+HistorySearch indexes instead of scanning every row, and writes the
+alerts through the HistoryWriter.
+
+    watchlist = Watchlist([("BG2417PR", "stolen"), ("KA01*", "fleet")], max_distance=1)
+    watchlist.match("8G24I7PR")      # [("BG2417PR", "stolen", 0.5)]
+    history = HistoryWriter("history.db", match=watchlist)
+    watchlist.add("NM7899KZ", "BOLO")
+    watchlist.backfill("NM7899KZ", HistorySearch("history.db"), history)
+"""
+import csv
+import fnmatch
+import re
+import threading
+
+from history_search import canonical, normalize, weighted_distance
+
+WILDCARDS = "*?"
+
+
+class _Node:
+    __slots__ = ("children", "star", "entries")
+
+    def __init__(self, star=False):
+        self.children = {}
+        self.star = star
+        self.entries = []
+
+
+def _deletes(key, depth):
+    """`key` and every string made from it by deleting up to `depth` characters."""
+    out = {key}
+    frontier = {key}
+    for _ in range(depth):
+        frontier = {s[:i] + s[i + 1:] for s in frontier for i in range(len(s))}
+        out |= frontier
+    return out
+
+
+class Watchlist:
+    """Exact, wildcard and confusion-aware fuzzy plate matching.
+
+    Entries are (pattern, label). A pattern containing `*` or `?` is a
+    wildcard and only matches as a wildcard. Other patterns match exactly
+    and, with `max_distance` > 0, fuzzily. Safe to update from one thread
+    while others match.
+    """
+
+    def __init__(self, entries=(), max_distance=0.0):
+        self.max_distance = max_distance
+        self._depth = int(max_distance)
+        self._lock = threading.Lock()
+        self._exact = {}      # normalized pattern -> label
+        self._folded = {}     # deletion variant of a folded pattern -> {normalized pattern}
+        self._root = _Node()
+        self._wildcards = {}  # normalized wildcard pattern -> label
+        for pattern, label in entries:
+            self.add(pattern, label)
+
+    @classmethod
+    def from_csv(cls, path, max_distance=0.0):
+        """Load `plate,label` rows (a header row starting with "plate" is skipped)."""
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = [r for r in csv.reader(f) if r and r[0].strip()]
+        if rows and rows[0][0].strip().lower() == "plate":
+            rows = rows[1:]
+        return cls(((r[0], r[1] if len(r) > 1 else None) for r in rows), max_distance)
+
+    def __len__(self):
+        return len(self._exact) + len(self._wildcards)
+
+    def __contains__(self, pattern):
+        key = normalize(pattern)
+        return key in self._exact or key in self._wildcards
+
+    # ---- compile -------------------------------------------------------
+    def add(self, pattern, label=None):
+        key = normalize(pattern)
+        if not key:
+            raise ValueError("empty watchlist pattern")
+        with self._lock:
+            if any(c in WILDCARDS for c in key):
+                if key not in self._wildcards:
+                    self._trie_node(key, create=True).entries.append(key)
+                self._wildcards[key] = label
+                return
+            if key not in self._exact and self.max_distance > 0:
+                for variant in _deletes(canonical(key), self._depth):
+                    self._folded.setdefault(variant, set()).add(key)
+            self._exact[key] = label
+
+    def remove(self, pattern):
+        key = normalize(pattern)
+        with self._lock:
+            if key in self._wildcards:
+                del self._wildcards[key]
+                self._trie_node(key).entries.remove(key)
+            elif key in self._exact:
+                del self._exact[key]
+                if self.max_distance > 0:
+                    for variant in _deletes(canonical(key), self._depth):
+                        keys = self._folded.get(variant)
+                        if keys is not None:
+                            keys.discard(key)
+                            if not keys:
+                                del self._folded[variant]
+            else:
+                raise KeyError(pattern)
+
+    def _trie_node(self, key, create=False):
+        node = self._root
+        for c in re.sub(r"\*+", "*", key):
+            child = node.children.get(c)
+            if child is None:
+                if not create:
+                    raise KeyError(key)
+                child = node.children[c] = _Node(star=c == "*")
+            node = child
+        return node
+
+    # ---- match ---------------------------------------------------------
+    @staticmethod
+    def _closure(nodes):
+        out, stack = {}, list(nodes)
+        while stack:
+            node = stack.pop()
+            if id(node) not in out:
+                out[id(node)] = node
+                star = node.children.get("*")
+                if star is not None:
+                    stack.append(star)
+        return out
+
+    def _match_wildcards(self, key):
+        states = self._closure([self._root])
+        for c in key:
+            step = []
+            for node in states.values():
+                if node.star:
+                    step.append(node)
+                for edge in (c, "?"):
+                    child = node.children.get(edge)
+                    if child is not None:
+                        step.append(child)
+            if not step:
+                return []
+            states = self._closure(step)
+        return [e for node in states.values() for e in node.entries]
+
+    def match(self, plate):
+        """[(pattern, label, distance), ...] for `plate`, closest first."""
+        key = normalize(plate)
+        if not key:
+            return []
+        with self._lock:
+            hits = {}
+            if key in self._exact:
+                hits[key] = 0.0
+            if self.max_distance > 0:
+                for variant in _deletes(canonical(key), self._depth):
+                    for candidate in self._folded.get(variant, ()):
+                        if candidate not in hits:
+                            d = weighted_distance(key, candidate, self.max_distance)
+                            if d <= self.max_distance:
+                                hits[candidate] = d
+            out = [(p, self._exact[p], d) for p, d in hits.items()]
+            if self._wildcards:
+                out += [(p, self._wildcards[p], 0.0) for p in self._match_wildcards(key)]
+        return sorted(out, key=lambda h: h[2])
+
+    __call__ = match
+
+    # ---- history -------------------------------------------------------
+    def history_hits(self, pattern, search, limit=None):
+        """Plates already in the history DB that `pattern` matches, using its indexes.
+
+        Exact patterns use the trigram index (and the fuzzy search when
+        max_distance > 0). Wildcards look up their longest literal run in
+        the index and check the rest in Python; a wildcard without three
+        literal characters in a row needs a scan.
+        """
+        key = normalize(pattern)
+        if any(c in WILDCARDS for c in key):
+            regex = re.compile(fnmatch.translate(key))
+            literal = max(re.split(r"[*?]+", key), key=len)
+            rows = (search.search(literal, limit=None) if len(literal) >= 3
+                    else search.iter_rows())
+            return [{**r, "distance": 0.0} for r in rows if regex.match(normalize(r["plate_text"]))]
+        if self.max_distance > 0:
+            return search.search(key, fuzzy=self.max_distance, limit=limit)
+        rows = search.search(key, limit=None)
+        return [{**r, "distance": 0.0} for r in rows if normalize(r["plate_text"]) == key][:limit]
+
+    def backfill(self, pattern, search, writer):
+        """Raise alerts for `pattern` on history recorded before it was added.
+
+        `search` is a HistorySearch and `writer` the HistoryWriter that owns
+        the DB. Plates that already have an alert for `pattern` are skipped.
+        Returns the number of alerts queued.
+        """
+        key = normalize(pattern)
+        label = self._wildcards.get(key, self._exact.get(key))
+        done = {row[0] for row in search.db.execute(
+            "SELECT plate_id FROM alerts WHERE watch = ?", (key,))}
+        return writer.submit_alerts(
+            {"detection_id": r["detection_id"], "plate_id": r["id"], "plate_text": r["plate_text"],
+             "watch": key, "label": label, "timestamp": r["timestamp"]}
+            for r in self.history_hits(key, search) if r["id"] not in done)
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    rng = random.Random(0)
+    letters, digits = "ABCDEFGHJKLMNPRSTUVWXYZ", "0123456789"
+
+    def _plate():
+        return ("".join(rng.choices(letters, k=2)) + "".join(rng.choices(digits, k=4))
+                + "".join(rng.choices(letters, k=2)))
+
+    N = 200_000
+    entries = [(_plate(), f"entry {i}") for i in range(N)]
+    entries += [(_plate()[:4] + "*", "prefix") for _ in range(1000)]
+    entries += [("?" + _plate()[1:6] + "*", "wildcard") for _ in range(1000)]
+
+    print(f"=== Compile {len(entries)} entries (max_distance=1) ===")
+    t0 = time.perf_counter()
+    watchlist = Watchlist(entries, max_distance=1)
+    print(f"  {time.perf_counter() - t0:.1f}s")
+
+    target, label = entries[123]
+    swaps = str.maketrans("012568", "OIZSGB")  # digits OCR commonly reads as letters
+    misread = target[:2] + target[2:6].translate(swaps) + target[6:]
+    queries = [target, misread, target[:-1] + "X"] + [_plate() for _ in range(2000)]
+
+    print(f"\n=== Match {len(queries)} plates ===")
+    t0 = time.perf_counter()
+    results = [watchlist.match(q) for q in queries]
+    per_plate = (time.perf_counter() - t0) / len(queries) * 1e6
+    print(f"  {per_plate:.0f} µs per plate")
+    for q, r in zip(queries[:3], results[:3]):
+        print(f"  {q:<10} -> {r[:3]}")
+
+    print(f"\n=== Linear scan over the same {len(entries)} entries ===")
+    t0 = time.perf_counter()
+    for q in queries[:3]:
+        key = normalize(q)
+        [p for p, _ in entries
+         if (fnmatch.fnmatchcase(key, p) if "*" in p or "?" in p
+             else weighted_distance(key, p, 1) <= 1)]
+    print(f"  {(time.perf_counter() - t0) / 3 * 1e6:.0f} µs per plate")
+
+    print("\nDone.")
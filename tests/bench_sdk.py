@@ -0,0 +1,302 @@
+"""
+MareArts ANPR — SDK Benchmark (V16)
+Just run:  python bench_sdk.py
+Sweep:     python bench_sdk.py --detectors 640p_fp32,320p_int8 --ocr fp32,int8 \\
+               --backends cpu,cuda --threads 1,4 --batch 1,8 --out bench.json
+Compare:   python bench_sdk.py --compare old.json new.json
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+if sys.platform == "win32" and hasattr(sys.stdout, "reconfigure"):
+    sys.stdout.reconfigure(encoding="utf-8")
+    sys.stderr.reconfigure(encoding="utf-8")
+
+SAMPLE = Path(__file__).resolve().parent.parent / "sample_images"
+EXAMPLES = Path(__file__).resolve().parent.parent / "python-sdk" / "examples"
+EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+STAGES = ("decode", "detect", "crop", "ocr", "history")
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1e6 if sys.platform == "darwin" else peak / 1e3  # bytes vs KB
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1e6
+    except (ImportError, AttributeError):
+        return None
+
+
+def _percentiles(values):
+    import numpy as np
+    if not values:
+        return {}
+    ms = np.asarray(values) * 1000
+    return {"p50": round(float(np.percentile(ms, 50)), 2),
+            "p95": round(float(np.percentile(ms, 95)), 2),
+            "p99": round(float(np.percentile(ms, 99)), 2),
+            "mean": round(float(ms.mean()), 2)}
+
+
+# ====================================================================
+#  ONE CONFIGURATION (runs in its own process)
+# ====================================================================
+def run_config(cfg):
+    """Benchmark one detector/OCR/backend/threads/batch combination.
+
+    `threads` is real concurrency. With batch > 1 each batch's decodes,
+    detections and reads are spread over that many pool threads. With
+    batch = 1 that many clients each send one image at a time, as
+    concurrent server requests do.
+    """
+    import numpy as np
+    from PIL import Image
+
+    sys.path.insert(0, str(EXAMPLES))
+    from batch_inference import box_conf, box_ltrb, crop_plate, get_executor, load_credentials
+    from marearts_anpr import ma_anpr_detector_v16, ma_anpr_ocr_v16
+
+    user, key, sig = load_credentials()
+    t0 = time.perf_counter()
+    detector = ma_anpr_detector_v16(cfg["detector"], user, key, sig, backend=cfg["backend"])
+    ocr = ma_anpr_ocr_v16(cfg["ocr"], cfg["region"], user, key, sig, backend=cfg["backend"])
+    load_sec = time.perf_counter() - t0
+
+    # The server stores every detection in SQLite; time the same kind of write.
+    db_dir = tempfile.TemporaryDirectory(prefix="anpr-bench-")
+    db = sqlite3.connect(os.path.join(db_dir.name, "history.db"), check_same_thread=False)
+    db.execute("CREATE TABLE detections (file TEXT, plate TEXT, ocr_conf REAL, "
+               "det_conf REAL, bbox TEXT, ts REAL)")
+
+    batch = cfg["batch"]
+    pool = get_executor(cfg["threads"]) if batch > 1 else None
+
+    def _map(fn, items):
+        return list(pool.map(fn, items)) if pool is not None and len(items) > 1 else [fn(i) for i in items]
+
+    def _decode(path):
+        return np.array(Image.open(path).convert("RGB"))[:, :, ::-1].copy()
+
+    def _ocr(crop):
+        return ocr.predict(crop) if crop is not None else ("", 0)
+
+    paths = [Path(p) for p in cfg["images"]]
+    work = paths * cfg["repeat"]
+    stages = {s: 0.0 for s in STAGES}
+    latencies = []
+    plates = 0
+    lock = threading.Lock()  # one history writer, shared tallies
+
+    def _process(chunk, record):
+        nonlocal plates
+        t = {}
+        start = time.perf_counter()
+        frames = _map(_decode, chunk)
+        t["decode"] = time.perf_counter()
+        detections = _map(detector.detector, frames)
+        t["detect"] = time.perf_counter()
+        crops, meta = [], []
+        for path, frame, boxes in zip(chunk, frames, detections):
+            for box in boxes:
+                ltrb = box_ltrb(box)
+                crops.append(crop_plate(frame, ltrb))
+                meta.append((path.name, ltrb, box_conf(box)))
+        t["crop"] = time.perf_counter()
+        reads = _map(_ocr, crops)
+        t["ocr"] = time.perf_counter()
+        with lock, db:
+            db.executemany("INSERT INTO detections VALUES (?, ?, ?, ?, ?, ?)",
+                           [(name, text, conf, det_conf, json.dumps(ltrb), time.time())
+                            for (name, ltrb, det_conf), (text, conf) in zip(meta, reads)])
+        t["history"] = time.perf_counter()
+        if not record:
+            return
+        with lock:
+            prev = start
+            for s in STAGES:
+                stages[s] += t[s] - prev
+                prev = t[s]
+            latencies.extend([t["history"] - start] * len(chunk))
+            plates += len(crops)
+
+    for i in range(min(cfg["warmup"], len(paths))):
+        _process([paths[i]], record=False)
+
+    wall = time.perf_counter()
+    if batch == 1 and cfg["threads"] > 1:
+        with ThreadPoolExecutor(cfg["threads"], thread_name_prefix="bench-client") as clients:
+            list(clients.map(lambda path: _process([path], record=True), work))
+    else:
+        for i in range(0, len(work), batch):
+            _process(work[i:i + batch], record=True)
+    wall = time.perf_counter() - wall
+    db.close()
+    db_dir.cleanup()
+
+    n = len(work)
+    return {
+        **{k: cfg[k] for k in ("detector", "ocr", "backend", "threads", "batch")},
+        "images": n,
+        "plates": plates,
+        "images_per_sec": round(n / wall, 2) if wall else 0.0,
+        "latency_ms": _percentiles(latencies),
+        "stages_ms": {s: round(stages[s] / n * 1000, 2) for s in STAGES},
+        "load_sec": round(load_sec, 2),
+        "peak_rss_mb": round(_peak_rss_mb() or 0.0, 1),
+    }
+
+
+# ====================================================================
+#  SWEEP
+# ====================================================================
+def _key(r):
+    return (r["detector"], r["ocr"], r["backend"], r["threads"], r["batch"])
+
+
+def _label(r):
+    return f"{r['detector']:<10} {r['ocr']:<5} {r['backend']:<5} t={r['threads']:<2} b={r['batch']:<3}"
+
+
+def sweep(args):
+    folder = Path(args.images)
+    images = sorted(str(p) for p in folder.iterdir() if p.suffix.lower() in EXTENSIONS)
+    if not images:
+        print(f"No images found in {folder}")
+        sys.exit(1)
+
+    sys.path.insert(0, str(EXAMPLES))
+    from batch_inference import load_credentials
+    if not all(load_credentials()):
+        print("No credentials. Run: ma-anpr config")
+        sys.exit(1)
+
+    import marearts_anpr
+    meta = {
+        "package_version": marearts_anpr.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "images_dir": str(folder),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    print("MareArts ANPR — SDK Benchmark (V16)")
+    print(f"Package : v{meta['package_version']}  Python {meta['python']}  {meta['processor']}")
+    print(f"Images  : {len(images)} from {folder}  (x{args.repeat})")
+
+    combos = list(itertools.product(args.detectors.split(","), args.ocr.split(","),
+                                    args.backends.split(","),
+                                    [int(t) for t in args.threads.split(",")],
+                                    [int(b) for b in args.batch.split(",")]))
+    print("\n" + "=" * 64)
+    print(f"  {len(combos)} configuration(s), each in a fresh process")
+    print("=" * 64)
+
+    results = []
+    for detector, ocr, backend, threads, batch in combos:
+        cfg = {"detector": detector, "ocr": ocr, "backend": backend, "threads": threads,
+               "batch": batch, "region": args.region, "images": images,
+               "repeat": args.repeat, "warmup": args.warmup}
+        env = dict(os.environ, OMP_NUM_THREADS=str(threads))
+        proc = subprocess.run([sys.executable, __file__, "--child"], input=json.dumps(cfg),
+                              env=env, capture_output=True, text=True)
+        lines = proc.stdout.strip().splitlines()
+        try:
+            r = json.loads(lines[-1])
+        except (IndexError, ValueError):
+            r = {**{k: cfg[k] for k in ("detector", "ocr", "backend", "threads", "batch")},
+                 "error": (proc.stderr.strip().splitlines() or ["no output"])[-1]}
+        results.append(r)
+        if "error" in r:
+            print(f"  ❌ {_label(r)}  {r['error']}")
+        else:
+            lat, st = r["latency_ms"], r["stages_ms"]
+            print(f"  ✅ {_label(r)}  {r['images_per_sec']:>7.1f} img/s  "
+                  f"p50 {lat['p50']:.1f} p95 {lat['p95']:.1f} p99 {lat['p99']:.1f} ms  "
+                  f"rss {r['peak_rss_mb']:.0f} MB")
+            print("       stages/img: " + "  ".join(f"{s} {st[s]:.1f}" for s in STAGES) + " ms")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+        print(f"\nSaved: {args.out}")
+    return 0 if all("error" not in r for r in results) else 1
+
+
+# ====================================================================
+#  COMPARE
+# ====================================================================
+def compare(old_path, new_path, tolerance):
+    old, new = json.load(open(old_path)), json.load(open(new_path))
+    print("MareArts ANPR — Benchmark Comparison")
+    print(f"Old: v{old['meta']['package_version']}  {old['meta']['timestamp']}  ({old_path})")
+    print(f"New: v{new['meta']['package_version']}  {new['meta']['timestamp']}  ({new_path})")
+    print(f"Regression when throughput drops or p95 rises by more than {tolerance}%\n")
+
+    before = {_key(r): r for r in old["results"] if "error" not in r}
+    regressions = 0
+    for r in new["results"]:
+        o = before.get(_key(r))
+        if o is None or "error" in r:
+            continue
+        d_ips = (r["images_per_sec"] - o["images_per_sec"]) / max(o["images_per_sec"], 1e-9) * 100
+        d_p95 = (r["latency_ms"]["p95"] - o["latency_ms"]["p95"]) / max(o["latency_ms"]["p95"], 1e-9) * 100
+        bad = d_ips < -tolerance or d_p95 > tolerance
+        regressions += bad
+        print(f"  {'❌' if bad else '✅'} {_label(r)}  "
+              f"{o['images_per_sec']:>7.1f} → {r['images_per_sec']:>7.1f} img/s ({d_ips:+.1f}%)  "
+              f"p95 {o['latency_ms']['p95']:.1f} → {r['latency_ms']['p95']:.1f} ms ({d_p95:+.1f}%)")
+
+    if regressions:
+        print(f"\n  ⚠️  {regressions} configuration(s) regressed")
+        return 1
+    print("\n  🎉 No regressions")
+    return 0
+
+
+# ====================================================================
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark V16 detector/OCR combinations")
+    parser.add_argument("--images", default=str(SAMPLE), help="Image folder (default: sample_images)")
+    parser.add_argument("--detectors", default="640p_fp32,640p_int8,320p_fp32,320p_int8")
+    parser.add_argument("--ocr", default="fp32,int8")
+    parser.add_argument("--backends", default="cpu")
+    parser.add_argument("--threads", default="1,4",
+                        help="Concurrent workers: pool threads per batch, or parallel "
+                             "single-image clients with batch 1")
+    parser.add_argument("--batch", default="1,8", help="Images per batched call")
+    parser.add_argument("--region", default="univ")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the image folder")
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured warm-up images")
+    parser.add_argument("--out", default=None, help="Write results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("--tolerance", type=float, default=10.0, help="Regression threshold in %%")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_config(json.load(sys.stdin))))
+        return
+    if args.compare:
+        sys.exit(compare(*args.compare, args.tolerance))
+    sys.exit(sweep(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""
+MareArts ANPR — Server Load Test
+Prerequisites:  ma-anpr server start
+Closed loop:    python load_server.py --concurrency 16 --duration 60
+Open loop:      python load_server.py --rps 40 --duration 60 --mix anpr=6,binary=2,batch=1,search=1
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+if sys.platform == "win32" and hasattr(sys.stdout, "reconfigure"):
+    sys.stdout.reconfigure(encoding="utf-8")
+    sys.stderr.reconfigure(encoding="utf-8")
+
+try:
+    import requests
+except ImportError:
+    print("ERROR: pip install requests")
+    sys.exit(1)
+
+# ── config ──────────────────────────────────────────────────────────
+BASE = "http://localhost:8000"
+SAMPLE = Path(__file__).resolve().parent.parent / "sample_images"
+EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+TIMEOUT = 60
+PERCENTILES = (50, 90, 95, 99, 99.9)
+
+
+# ====================================================================
+#  LATENCY HISTOGRAM
+# ====================================================================
+class LatencyHistogram:
+    """Log-bucketed latency histogram in the spirit of HdrHistogram.
+
+    Buckets grow by `1 + precision`, so every recorded value is known to
+    within `precision` (1% by default) from 10 µs up to any latency, in a
+    few hundred counters regardless of how many requests are recorded.
+    """
+
+    def __init__(self, precision=0.01, lowest_sec=1e-5):
+        self.lowest = lowest_sec
+        self.log_base = math.log1p(precision)
+        self.counts = Counter()
+        self.total = 0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def _index(self, sec):
+        return max(int(math.log(max(sec, self.lowest) / self.lowest) / self.log_base), 0)
+
+    def _value(self, index):
+        return self.lowest * math.exp((index + 1) * self.log_base)  # bucket upper edge
+
+    def record(self, sec):
+        with self._lock:
+            self.counts[self._index(sec)] += 1
+            self.total += 1
+            self.max = max(self.max, sec)
+
+    def merge(self, other):
+        with self._lock:
+            self.counts.update(other.counts)
+            self.total += other.total
+            self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        """Latency in seconds at percentile `p` (0-100)."""
+        if not self.total:
+            return 0.0
+        rank = max(int(math.ceil(p / 100.0 * self.total)), 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._value(index), self.max)
+        return self.max
+
+    def hgrm(self):
+        """Percentile distribution in HdrHistogram's .hgrm text format (ms)."""
+        lines = [f"{'Value':>12} {'Percentile':>14} {'TotalCount':>10} {'1/(1-Percentile)':>14}", ""]
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            q = seen / self.total
+            inv = f"{1 / (1 - q):14.2f}" if q < 1 else f"{'inf':>14}"
+            lines.append(f"{min(self._value(index), self.max) * 1000:12.3f} {q:14.12f} {seen:10d} {inv}")
+        lines.append(f"#[Max = {self.max * 1000:.3f}, Total count = {self.total}]")
+        return "\n".join(lines) + "\n"
+
+
+# ====================================================================
+#  REQUESTS
+# ====================================================================
+def load_corpus(folder, limit=200):
+    paths = sorted(p for p in Path(folder).iterdir() if p.suffix.lower() in EXTENSIONS)[:limit]
+    if not paths:
+        print(f"No images found in {folder}")
+        sys.exit(1)
+    return [(p.name, p.read_bytes()) for p in paths]
+
+
+def build_endpoints(corpus, batch_size):
+    """name -> fn(session) returning a requests.Response."""
+    def _pick():
+        return random.choice(corpus)
+
+    def anpr(s):
+        name, data = _pick()
+        return s.post(f"{BASE}/api/anpr", files={"image": (name, data)}, timeout=TIMEOUT)
+
+    def binary(s):
+        _, data = _pick()
+        return s.post(f"{BASE}/api/anpr/binary", data=data, timeout=TIMEOUT,
+                      headers={"Content-Type": "application/octet-stream"})
+
+    def batch(s):
+        files = [("images", _pick()) for _ in range(batch_size)]
+        return s.post(f"{BASE}/api/anpr/batch", files=files, timeout=TIMEOUT)
+
+    def mmc(s):
+        name, data = _pick()
+        return s.post(f"{BASE}/api/anpr/mmc", files={"image": (name, data)}, timeout=TIMEOUT)
+
+    def history(s):
+        return s.get(f"{BASE}/api/history", params={"limit": 50}, timeout=TIMEOUT)
+
+    def search(s):
+        return s.get(f"{BASE}/api/history/search",
+                     params={"q": random.choice("0123456789ABCDEFGHJKLMNPRSTUVWXYZ"),
+                             "limit": 20}, timeout=TIMEOUT)
+
+    return {"anpr": anpr, "binary": binary, "batch": batch, "mmc": mmc,
+            "history": history, "search": search}
+
+
+def parse_mix(text, endpoints):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in endpoints:
+            print(f"ERROR: unknown endpoint '{name}' (choose from {', '.join(endpoints)})")
+            sys.exit(1)
+        mix[name] = float(weight or 1)
+    return mix
+
+
+# ====================================================================
+#  LOAD GENERATOR
+# ====================================================================
+class LoadRun:
+    """Per-endpoint histograms, status counts and a per-second timeline."""
+
+    def __init__(self, endpoints, mix, warmup):
+        self.endpoints = endpoints
+        self.names = list(mix)
+        self.weights = [mix[n] for n in self.names]
+        self.warmup = warmup
+        self.hist = defaultdict(LatencyHistogram)
+        self.status = defaultdict(Counter)
+        self.timeline = defaultdict(lambda: {"requests": 0, "errors": 0, "hist": LatencyHistogram()})
+        self.queue_samples = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.t_start = None
+
+    def _session(self):
+        s = getattr(self._local, "session", None)
+        if s is None:
+            s = self._local.session = requests.Session()
+        return s
+
+    def one(self, scheduled=None):
+        """Send one request; latency counts from `scheduled` (open loop) if given."""
+        name = random.choices(self.names, self.weights)[0]
+        start = time.perf_counter()
+        try:
+            r = self.endpoints[name](self._session())
+            outcome = r.status_code
+        except requests.RequestException as e:
+            outcome = type(e).__name__
+        end = time.perf_counter()
+        latency = end - (scheduled if scheduled is not None else start)
+        second = int(end - self.t_start)
+        if end - self.t_start < self.warmup:
+            return
+        ok = isinstance(outcome, int) and outcome < 400
+        with self._lock:
+            self.hist[name].record(latency)
+            self.status[name][outcome] += 1
+            slot = self.timeline[second]
+            slot["requests"] += 1
+            slot["errors"] += not ok
+            slot["hist"].record(latency)
+
+    def poll_queue(self, stop, interval):
+        """Sample GET /api/threads until `stop` is set."""
+        s = requests.Session()
+        while not stop.wait(interval):
+            try:
+                info = s.get(f"{BASE}/api/threads", timeout=5).json()
+            except (requests.RequestException, ValueError):
+                continue
+            numeric = {k: v for k, v in info.items() if isinstance(v, (int, float))}
+            self.queue_samples.append((round(time.perf_counter() - self.t_start, 1), numeric))
+
+    def closed_loop(self, concurrency, duration):
+        stop_at = self.t_start + duration
+
+        def worker():
+            while time.perf_counter() < stop_at:
+                self.one()
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def open_loop(self, rps, duration, max_inflight):
+        """Fire at a fixed rate; latency includes time spent waiting to be sent."""
+        interval = 1.0 / rps
+        with ThreadPoolExecutor(max_inflight) as pool:
+            n = 0
+            while True:
+                scheduled = self.t_start + n * interval
+                if scheduled - self.t_start >= duration:
+                    break
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self.one, scheduled)
+                n += 1
+
+
+# ====================================================================
+#  REPORT
+# ====================================================================
+def report(run, duration, args):
+    measured = max(duration - args.warmup, 1e-9)
+    total = LatencyHistogram()
+    print("\n" + "=" * 64)
+    print("  Latency (ms) and errors per endpoint")
+    print("=" * 64)
+    print(f"  {'endpoint':<9} {'reqs':>7} {'rps':>7} {'err%':>6} "
+          + " ".join(f"{'p' + format(p, 'g'):>8}" for p in PERCENTILES) + f" {'max':>8}")
+    summary = {}
+    for name in run.names:
+        h = run.hist[name]
+        if not h.total:
+            continue
+        total.merge(h)
+        errors = sum(n for code, n in run.status[name].items()
+                     if not (isinstance(code, int) and code < 400))
+        pct = {format(p, "g"): round(h.percentile(p) * 1000, 2) for p in PERCENTILES}
+        summary[name] = {"requests": h.total, "rps": round(h.total / measured, 2),
+                         "error_rate": round(errors / h.total, 4),
+                         "status": {str(k): v for k, v in run.status[name].items()},
+                         "latency_ms": {**pct, "max": round(h.max * 1000, 2)}}
+        print(f"  {name:<9} {h.total:>7} {h.total / measured:>7.1f} {errors / h.total * 100:>5.1f}% "
+              + " ".join(f"{v:>8.1f}" for v in pct.values()) + f" {h.max * 1000:>8.1f}")
+        if errors:
+            print(f"            status: {dict(run.status[name])}")
+    print(f"  {'all':<9} {total.total:>7} {total.total / measured:>7.1f}        "
+          + " ".join(f"{total.percentile(p) * 1000:>8.1f}" for p in PERCENTILES)
+          + f" {total.max * 1000:>8.1f}")
+
+    print("\n" + "=" * 64)
+    print("  Timeline (per second) and server threads")
+    print("=" * 64)
+    samples = dict((int(t), q) for t, q in run.queue_samples)
+    for second in sorted(run.timeline):
+        slot = run.timeline[second]
+        q = samples.get(second)
+        print(f"  t={second:>4}s  {slot['requests']:>5} req  {slot['errors']:>4} err  "
+              f"p95 {slot['hist'].percentile(95) * 1000:>8.1f} ms  {q if q else ''}")
+
+    if args.hgrm:
+        with open(args.hgrm, "w") as f:
+            f.write(total.hgrm())
+        print(f"\nSaved: {args.hgrm}  (plot at hdrhistogram.github.io/HdrHistogram/plotFiles.html)")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"base": BASE, "mode": "rps" if args.rps else "concurrency",
+                       "target": args.rps or args.concurrency, "duration": duration,
+                       "endpoints": summary,
+                       "timeline": [{"t": s, "requests": run.timeline[s]["requests"],
+                                     "errors": run.timeline[s]["errors"],
+                                     "p95_ms": round(run.timeline[s]["hist"].percentile(95) * 1000, 2)}
+                                    for s in sorted(run.timeline)],
+                       "threads": run.queue_samples}, f, indent=2)
+        print(f"Saved: {args.out}")
+
+    failed = sum(1 for e in summary.values() if e["error_rate"] > args.max_error_rate)
+    return 1 if failed else 0
+
+
+# ====================================================================
+def main():
+    global BASE
+    parser = argparse.ArgumentParser(description="Load-test a running ma-anpr server")
+    parser.add_argument("--base", default=BASE, help=f"Server URL (default: {BASE})")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--concurrency", type=int, default=None, help="Closed loop: N clients (default 4)")
+    mode.add_argument("--rps", type=float, default=None, help="Open loop: requests per second")
+    parser.add_argument("--max-inflight", type=int, default=256, help="Open-loop in-flight cap")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds (default: 30)")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds not recorded")
+    parser.add_argument("--mix", default="anpr=6,binary=2,batch=1,search=1",
+                        help="Endpoint weights: anpr, binary, batch, mmc, history, search")
+    parser.add_argument("--batch-size", type=int, default=4, help="Images per /api/anpr/batch call")
+    parser.add_argument("--images", default=str(SAMPLE), help="Image folder (default: sample_images)")
+    parser.add_argument("--poll", type=float, default=1.0, help="GET /api/threads interval (s)")
+    parser.add_argument("--max-error-rate", type=float, default=0.01,
+                        help="Exit 1 if any endpoint's error rate exceeds this")
+    parser.add_argument("--out", default=None, help="Write a JSON report")
+    parser.add_argument("--hgrm", default=None, help="Write the overall histogram (.hgrm)")
+    args = parser.parse_args()
+    BASE = args.base.rstrip("/")
+
+    try:
+        requests.get(f"{BASE}/api/health", timeout=5).raise_for_status()
+    except requests.RequestException as e:
+        print(f"ERROR: server not reachable at {BASE} ({e})")
+        print("Start it with: ma-anpr server start")
+        sys.exit(1)
+
+    corpus = load_corpus(args.images)
+    endpoints = build_endpoints(corpus, args.batch_size)
+    mix = parse_mix(args.mix, endpoints)
+    if "mmc" in mix:
+        try:
+            if requests.get(f"{BASE}/api/mmc/status", timeout=5).json().get("available"):
+                print("NOTE: MMC is enabled; /api/anpr/mmc latency includes the cloud call and uses quota.")
+                print("      Set mmc.enabled: false in the server config to measure local work only.")
+        except (requests.RequestException, ValueError):
+            pass
+
+    print("MareArts ANPR — Server Load Test")
+    print(f"Server : {BASE}")
+    print("Mode   : " + (f"open loop, {args.rps:g} req/s" if args.rps
+                          else f"closed loop, {args.concurrency or 4} clients"))
+    print(f"Mix    : {mix}  ({len(corpus)} images)")
+    print(f"Time   : {args.duration:g}s (first {args.warmup:g}s not recorded)")
+
+    run = LoadRun(endpoints, mix, args.warmup)
+    stop = threading.Event()
+    run.t_start = time.perf_counter()
+    poller = threading.Thread(target=run.poll_queue, args=(stop, args.poll), daemon=True)
+    poller.start()
+    try:
+        if args.rps:
+            run.open_loop(args.rps, args.duration, args.max_inflight)
+        else:
+            run.closed_loop(args.concurrency or 4, args.duration)
+    except KeyboardInterrupt:
+        print("\nInterrupted")
+    stop.set()
+    duration = time.perf_counter() - run.t_start
+    sys.exit(report(run, duration, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+"""
+MareArts ANPR — Example Logic Test (no credentials, no models)
+Just run:  python test_examples.py
+
+Covers the pure-Python parts of python-sdk/examples with a stub
+detector and OCR, a synthetic video written with OpenCV and temporary
+SQLite databases.
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+if sys.platform == "win32" and hasattr(sys.stdout, "reconfigure"):
+    sys.stdout.reconfigure(encoding="utf-8")
+    sys.stderr.reconfigure(encoding="utf-8")
+
+EXAMPLES = Path(__file__).resolve().parent.parent / "python-sdk" / "examples"
+sys.path.insert(0, str(EXAMPLES))
+
+TMP = Path(tempfile.mkdtemp(prefix="anpr-test-"))
+
+# ── result tracking ─────────────────────────────────────────────────
+_results = []
+
+def _run(label, fn):
+    t0 = time.perf_counter()
+    try:
+        detail = fn()
+        dt = time.perf_counter() - t0
+        _results.append(("PASS", label, f"{dt:.2f}s", detail or ""))
+        print(f"  ✅ {label}  ({dt:.2f}s)  {detail or ''}")
+    except Exception as e:
+        dt = time.perf_counter() - t0
+        _results.append(("FAIL", label, f"{dt:.2f}s", str(e)))
+        print(f"  ❌ {label}  ({dt:.2f}s)  {e!r}")
+
+
+def _history(name, plates):
+    """A history DB at TMP/name holding one detection per plate text."""
+    from history_writer import HistoryWriter
+
+    path = TMP / name
+    with HistoryWriter(path) as writer:
+        for text in plates:
+            writer.submit({"results": [{"plate_text": text, "confidence": 90.0}]})
+    return path
+
+
+# ── stub models ─────────────────────────────────────────────────────
+# A "plate" is a flat patch of one grey level; the stub detector boxes
+# every patch and the stub OCR reads the text that level stands for.
+PLATES = {200: "AB123", 120: "CD4567"}
+
+
+class StubDetector:
+    iou_thres = 0.5
+
+    def __init__(self, fail_on=None):
+        self.calls = 0
+        self.fail_on = fail_on
+
+    def detector(self, frame):
+        self.calls += 1
+        if self.fail_on is not None and frame[0, 0, 0] == self.fail_on:
+            raise ValueError("stub detector failure")
+        boxes = []
+        for level in PLATES:
+            ys, xs = np.nonzero(np.abs(frame[:, :, 0].astype(int) - level) < 20)
+            if len(xs) > 20:
+                boxes.append({"bbox": [int(xs.min()), int(ys.min()),
+                                       int(xs.max()) + 1, int(ys.max()) + 1], "score": 0.9})
+        return boxes
+
+
+class StubOcr:
+    def __init__(self, misread_first=False):
+        self.calls = 0
+        self.misread_first = misread_first
+        self._seen = set()
+
+    def predict(self, crop):
+        self.calls += 1
+        level = min(PLATES, key=lambda v: abs(v - float(np.median(np.asarray(crop)))))
+        text = PLATES[level]
+        if self.misread_first and level not in self._seen:
+            self._seen.add(level)
+            return text.replace("B", "8").replace("D", "0"), 60.0
+        return text, 95.0
+
+
+# ====================================================================
+#  1. WATCHLIST
+# ====================================================================
+def test_watchlist():
+    print("\n" + "=" * 64)
+    print("  1. Watchlist")
+    print("=" * 64)
+
+    from history_search import HistorySearch
+    from history_writer import HistoryWriter
+    from watchlist import Watchlist
+
+    plates = ["DW-7244 RV", "dw 7245", "XDW72", "BG2417PR", "KA01AB1234"]
+    path = _history("watchlist.db", plates)
+
+    def _backfill_agrees_with_match():
+        for pattern, fuzzy in (("DW72*", 0), ("DW7244RV", 0), ("?W724*", 0), ("8G24I7PR", 1)):
+            watchlist = Watchlist([(pattern, "test")], max_distance=fuzzy)
+            live = sorted(p for p in plates if watchlist.match(p))
+            search = HistorySearch(path)
+            with HistoryWriter(path) as writer:
+                queued = watchlist.backfill(pattern, search, writer)
+            hits = sorted(r["plate_text"] for r in watchlist.history_hits(pattern, search))
+            search.close()
+            assert hits == live, f"{pattern}: backfill {hits} != match {live}"
+            assert queued == len(live), f"{pattern}: queued {queued}, expected {len(live)}"
+        return "DW72* → DW-7244 RV, dw 7245"
+    _run("backfill finds what match() finds", _backfill_agrees_with_match)
+
+    def _backfill_once():
+        watchlist = Watchlist([("DW72*", "test")])
+        search = HistorySearch(path)
+        with HistoryWriter(path) as writer:
+            again = watchlist.backfill("DW72*", search, writer)
+        search.close()
+        assert again == 0, f"{again} duplicate alerts"
+        return "no duplicate alerts"
+    _run("backfill skips plates already alerted", _backfill_once)
+
+    def _fuzzy():
+        watchlist = Watchlist([("BG2417PR", "stolen"), ("KA01*", "fleet")], max_distance=1)
+        hits = watchlist.match("8G24I7PR")
+        assert hits == [("BG2417PR", "stolen", 0.5)], hits
+        assert [h[0] for h in watchlist.match("ka-01 xy")] == ["KA01*"]
+        assert watchlist.match("ZZ999") == []
+        return f"{hits[0][0]} at {hits[0][2]}"
+    _run("match() exact / wildcard / confusables", _fuzzy)
+
+
+# ====================================================================
+#  2. PLATE VOTING
+# ====================================================================
+def test_plate_voting():
+    print("\n" + "=" * 64)
+    print("  2. Plate Voting")
+    print("=" * 64)
+
+    from plate_voting import PlateVote
+
+    def _majority():
+        vote = PlateVote(threshold=60)
+        for text, conf in (("AB123", 80), ("A8123", 60), ("AB123", 85)):
+            vote.add(text, conf)
+        text, conf = vote.consensus()
+        assert text == "AB123", text
+        assert vote.done, f"not done at {conf}"
+        return f"{text} @ {conf}"
+    _run("confidence-weighted majority per character", _majority)
+
+    def _one_read_not_done():
+        vote = PlateVote(threshold=90)
+        vote.add("AB123", 99)
+        assert not vote.done, "done after a single read"
+        assert vote.consensus()[1] < 99, vote.consensus()
+        return f"1 read → {vote.consensus()[1]}"
+    _run("one read never reaches the threshold", _one_read_not_done)
+
+    def _length_vote():
+        vote = PlateVote()
+        for text, conf in (("AB123", 70), ("AB1234", 99), ("AB123", 75), ("", 0)):
+            vote.add(text, conf)
+        text, conf = vote.consensus()
+        assert text == "AB123", text
+        return f"{text} @ {conf}"
+    _run("plate length is voted first", _length_vote)
+
+    def _max_reads():
+        vote = PlateVote(max_reads=4)
+        for text in ("AB123", "XY987", "QQ555", "ZZ000"):
+            vote.add(text, 50)
+        assert vote.done, "still asking for OCR after max_reads"
+        assert PlateVote().consensus() == ("", 0)
+        return "done after 4 disagreeing reads"
+    _run("max_reads stops OCR on plates that never agree", _max_reads)
+
+
+# ====================================================================
+#  3. VIDEO STREAM
+# ====================================================================
+def test_video_stream():
+    print("\n" + "=" * 64)
+    print("  3. Video Stream")
+    print("=" * 64)
+
+    try:
+        import cv2
+    except ImportError:
+        print("  ⏭️  skipped (pip install opencv-python)")
+        return
+
+    # Plate AB123 drives right over frames 0-59, CD4567 enters at frame 40.
+    path = str(TMP / "synthetic.avi")
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 25, (320, 240))
+    for i in range(80):
+        frame = np.zeros((240, 320, 3), np.uint8)
+        if i < 60:
+            frame[60:80, 10 + i * 3:50 + i * 3] = 200
+        if i >= 40:
+            frame[160:182, 250 - (i - 40) * 2:300 - (i - 40) * 2] = 120
+        out.write(frame)
+    out.release()
+
+    from video_stream import marearts_anpr_from_video
+
+    def _tracks():
+        detector, ocr, finals = StubDetector(), StubOcr(misread_first=True), []
+        # One 60% misread, then 95% reads: the vote passes 75 on the fourth read.
+        frames = list(marearts_anpr_from_video(detector, ocr, path, detect_every=5,
+                                               min_ocr_conf=75, on_final=finals.append))
+        assert len(frames) == 80, len(frames)
+        assert detector.calls == 16, f"{detector.calls} detector calls"
+        assert [f["detected"] for f in frames[:6]] == [True, False, False, False, False, True]
+        reads = sorted((r["ocr"], r["reads"]) for r in finals)
+        assert reads == [("AB123", 4), ("CD4567", 4)], finals
+        assert ocr.calls == 8, f"{ocr.calls} OCR calls"
+        ids = {r["track_id"] for f in frames for r in f["results"]}
+        assert len(ids) == 2, f"track ids {ids}"
+        return f"{detector.calls} detections, {ocr.calls} OCR calls, finals {reads}"
+    _run("tracks, votes and reports each plate once", _tracks)
+
+    def _predicted_boxes():
+        frames = list(marearts_anpr_from_video(StubDetector(), StubOcr(), path,
+                                               detect_every=5, max_frames=10))
+        xs = [f["results"][0]["ltrb"][0] for f in frames[5:10]]
+        assert len(frames) == 10, len(frames)
+        assert all(b - a in (2, 3, 4) for a, b in zip(xs, xs[1:])), xs
+        assert not any(r["ocr_fresh"] for f in frames if not f["detected"] for r in f["results"])
+        return f"x between detections: {xs}"
+    _run("boxes move with the plate between detections", _predicted_boxes)
+
+    def _missing_source():
+        try:
+            list(marearts_anpr_from_video(StubDetector(), StubOcr(), str(TMP / "nope.mp4")))
+        except IOError as e:
+            return str(e)
+        raise AssertionError("no error for a missing file")
+    _run("missing source raises IOError", _missing_source)
+
+
+# ====================================================================
+#  4. HISTORY SEARCH
+# ====================================================================
+def test_history_search():
+    print("\n" + "=" * 64)
+    print("  4. History Search")
+    print("=" * 64)
+
+    from history_search import HistorySearch, weighted_distance
+
+    plates = ["BG2417PR", "8G24I7PR", "BG2417PK", "BG-2417 PR", "XX000000", "BG24"]
+    path = _history("search.db", plates)
+
+    def _ranking():
+        search = HistorySearch(path)
+        rows = search.search("BG2417PR", fuzzy=1)
+        got = [(r["plate_text"], r["distance"]) for r in rows]
+        search.close()
+        # Equal distances come newest first.
+        assert got == [("BG-2417 PR", 0.0), ("BG2417PR", 0.0), ("8G24I7PR", 0.5),
+                       ("BG2417PK", 1.0)], got
+        assert weighted_distance("BG2417PR", "8G24I7PR") == 0.5
+        return " > ".join(f"{t} ({d})" for t, d in got)
+    _run("fuzzy ranks confusable swaps before other edits", _ranking)
+
+    def _same_without_index():
+        search = HistorySearch(path)
+        indexed = [(r["id"], r["distance"]) for r in search.search("BG2417PR", fuzzy=2)]
+        search.fts = False
+        scanned = [(r["id"], r["distance"]) for r in search.search("BG2417PR", fuzzy=2)]
+        substring = [r["plate_text"] for r in search.search("G2417")]
+        search.close()
+        assert indexed == scanned, f"{indexed} != {scanned}"
+        assert sorted(substring) == ["BG-2417 PR", "BG2417PK", "BG2417PR"], substring
+        return f"{len(indexed)} fuzzy rows either way"
+    _run("trigram index and scan agree", _same_without_index)
+
+    def _paging():
+        search = HistorySearch(path)
+        seen, cursor = [], None
+        while True:
+            page = search.page(limit=4, cursor=cursor)
+            seen += [r["id"] for r in page["items"]]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        search.close()
+        assert seen == sorted(seen, reverse=True) and len(seen) == len(plates), seen
+        return f"{len(seen)} rows in {-(-len(seen) // 4)} pages"
+    _run("keyset paging visits every row once", _paging)
+
+
+# ====================================================================
+#  5. MICRO-BATCH & PROCESS POOL ERRORS
+# ====================================================================
+def test_error_paths():
+    print("\n" + "=" * 64)
+    print("  5. Micro-Batch & Process Pool Errors")
+    print("=" * 64)
+
+    from micro_batch import MicroBatcher
+
+    def _frame(level):
+        frame = np.zeros((120, 160, 3), np.uint8)
+        frame[40:60, 40:100] = 200
+        frame[0, 0] = level
+        return frame
+
+    def _one_bad_frame():
+        with MicroBatcher(StubDetector(fail_on=1), StubOcr(), max_batch_size=8,
+                          max_wait_ms=50, workers=2) as batcher:
+            futures = [batcher.submit(_frame(1 if i == 3 else 0)) for i in range(6)]
+            errors = [f.exception(10) for f in futures]
+            stats = batcher.stats()
+        assert [e is not None for e in errors] == [False, False, False, True, False, False], errors
+        assert all(f.result()["results"][0]["ocr"] == "AB123"
+                   for f, e in zip(futures, errors) if e is None)
+        return f"1 of 6 failed, batches {stats['batch_sizes']}"
+    _run("MicroBatcher fails only the bad frame", _one_bad_frame)
+
+    def _closed():
+        batcher = MicroBatcher(StubDetector(), StubOcr())
+        batcher.close()
+        try:
+            batcher.submit(_frame(0))
+        except RuntimeError as e:
+            return str(e)
+        raise AssertionError("submit() after close() did not raise")
+    _run("MicroBatcher rejects submit() after close()", _closed)
+
+    def _pool_startup():
+        from process_pool import AnprProcessPool
+        try:
+            AnprProcessPool(processes=1, credentials=("test", "test", "test"), pin_cores=False,
+                            slot_mb=1, startup_timeout=120)
+        except RuntimeError as e:
+            return str(e)[:60]
+        raise AssertionError("pool started with invalid credentials")
+    _run("AnprProcessPool reports workers that fail to start", _pool_startup)
+
+
+# ====================================================================
+#  REPORT
+# ====================================================================
+def report():
+    print("\n" + "=" * 64)
+    print("  REPORT")
+    print("=" * 64)
+
+    total = len(_results)
+    passed = sum(1 for r in _results if r[0] == "PASS")
+    failed = total - passed
+
+    print(f"\n  Total : {total}")
+    print(f"  Passed: {passed}")
+    print(f"  Failed: {failed}")
+
+    if failed:
+        print("\n  Failed tests:")
+        for status, label, dt, detail in _results:
+            if status == "FAIL":
+                print(f"    ❌ {label}  →  {detail}")
+        print(f"\n  ⚠️  {failed} test(s) FAILED")
+        return 1
+    else:
+        print(f"\n  🎉 ALL {total} TESTS PASSED")
+        return 0
+
+
+# ====================================================================
+def main():
+    print("MareArts ANPR — Example Logic Test")
+    print(f"Examples: {EXAMPLES}")
+    print(f"Temp    : {TMP}")
+
+    test_watchlist()
+    test_plate_voting()
+    test_video_stream()
+    test_history_search()
+    test_error_paths()
+
+    rc = report()
+    sys.exit(rc)
+
+
+if __name__ == "__main__":
+    main()